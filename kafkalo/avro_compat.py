@@ -0,0 +1,227 @@
+import json
+from typing import List
+
+PRIMITIVES = ("null", "boolean", "int", "long", "float", "double", "bytes", "string")
+# writer type: reader types it can be promoted to
+PROMOTIONS = {
+    "int": ("long", "float", "double"),
+    "long": ("float", "double"),
+    "float": ("double",),
+    "string": ("bytes",),
+    "bytes": ("string",),
+}
+NAMED = ("record", "enum", "fixed", "error")
+# attributes a complex type can't do without
+REQUIRED = {
+    "record": ("name",),
+    "error": ("name",),
+    "enum": ("name", "symbols"),
+    "fixed": ("name", "size"),
+    "array": ("items",),
+    "map": ("values",),
+}
+
+
+class AvroSchemaError(Exception):
+    """
+    Raised when a schema can't be parsed
+    """
+
+    pass
+
+
+class _Schema(object):
+    """
+    A parsed Avro schema with its named types resolved
+    """
+
+    def __init__(self, schema_str: str):
+        try:
+            self.schema = json.loads(schema_str)
+        except ValueError as e:
+            raise AvroSchemaError(f"Invalid schema JSON: {e}")
+        self.names = {}
+        self._collect_names(self.schema, None)
+
+    def _fullname(self, name, namespace):
+        if "." in name or not namespace:
+            return name
+        return f"{namespace}.{name}"
+
+    def _collect_names(self, schema, namespace):
+        if isinstance(schema, list):
+            for branch in schema:
+                self._collect_names(branch, namespace)
+            return
+        if not isinstance(schema, dict):
+            return
+        schema_type = schema.get("type")
+        missing = [x for x in REQUIRED.get(schema_type, ()) if x not in schema]
+        if missing:
+            raise AvroSchemaError(f"Malformed {schema_type} schema: missing {missing}")
+        if schema_type in NAMED:
+            namespace = schema.get("namespace", namespace)
+            fullname = self._fullname(schema["name"], namespace)
+            if "." in fullname:
+                namespace = fullname.rsplit(".", 1)[0]
+            self.names[fullname] = (schema, namespace)
+            self.names.setdefault(fullname.rsplit(".", 1)[-1], (schema, namespace))
+            for field in schema.get("fields", []):
+                if "name" not in field or "type" not in field:
+                    raise AvroSchemaError(f"Malformed field in {fullname}: {field}")
+                self._collect_names(field["type"], namespace)
+        elif schema_type == "array":
+            self._collect_names(schema["items"], namespace)
+        elif schema_type == "map":
+            self._collect_names(schema["values"], namespace)
+        elif isinstance(schema_type, (dict, list)):
+            self._collect_names(schema_type, namespace)
+
+    def resolve(self, schema):
+        """
+        Return the schema dict/list for schema, resolving references to
+        named types and normalizing primitives to {"type": name}
+        """
+        if isinstance(schema, str):
+            if schema in PRIMITIVES:
+                return {"type": schema}
+            if schema in self.names:
+                return self.names[schema][0]
+            raise AvroSchemaError(f"Unknown type {schema}")
+        if isinstance(schema, dict) and isinstance(schema.get("type"), (dict, list)):
+            return self.resolve(schema["type"])
+        if isinstance(schema, dict) and schema.get("type") not in PRIMITIVES + NAMED:
+            if schema.get("type") in ("array", "map"):
+                return schema
+            return self.resolve(schema["type"])
+        return schema
+
+
+def _type_name(schema):
+    if isinstance(schema, list):
+        return "union"
+    return schema["type"]
+
+
+def _names_match(reader, writer):
+    reader_names = {reader["name"].rsplit(".", 1)[-1]}
+    reader_names |= {x.rsplit(".", 1)[-1] for x in reader.get("aliases", [])}
+    return writer["name"].rsplit(".", 1)[-1] in reader_names
+
+
+class _Checker(object):
+    def __init__(self, reader: _Schema, writer: _Schema):
+        self.reader = reader
+        self.writer = writer
+        # (reader name, writer name) pairs being checked, for recursive types
+        self.seen = set()
+
+    def check(self, reader, writer, path):
+        reader = self.reader.resolve(reader)
+        writer = self.writer.resolve(writer)
+        reader_type = _type_name(reader)
+        writer_type = _type_name(writer)
+
+        if writer_type == "union":
+            errors = []
+            for branch in writer:
+                errors += self.check(reader, branch, path)
+            return errors
+        if reader_type == "union":
+            for branch in reader:
+                if not self.check(branch, writer, path):
+                    return []
+            return [f"{path}: {writer_type} is not in the reader union"]
+        if reader_type == writer_type:
+            return self._check_same_type(reader, writer, reader_type, path)
+        if reader_type in PROMOTIONS.get(writer_type, ()):
+            return []
+        return [f"{path}: {writer_type} can't be read as {reader_type}"]
+
+    def _check_same_type(self, reader, writer, schema_type, path):
+        if schema_type in PRIMITIVES:
+            return []
+        if schema_type == "array":
+            return self.check(reader["items"], writer["items"], f"{path}[]")
+        if schema_type == "map":
+            return self.check(reader["values"], writer["values"], f"{path}{{}}")
+        if not _names_match(reader, writer):
+            return [f"{path}: name {writer['name']} doesn't match {reader['name']}"]
+        if schema_type == "fixed":
+            if reader["size"] != writer["size"]:
+                return [
+                    f"{path}: fixed size {writer['size']} doesn't match "
+                    f"{reader['size']}"
+                ]
+            return []
+        if schema_type == "enum":
+            if "default" in reader:
+                return []
+            missing = [x for x in writer["symbols"] if x not in reader["symbols"]]
+            if missing:
+                return [f"{path}: reader enum is missing symbols {missing}"]
+            return []
+        return self._check_record(reader, writer, path)
+
+    def _check_record(self, reader, writer, path):
+        key = (reader["name"], writer["name"])
+        if key in self.seen:
+            return []
+        self.seen.add(key)
+        writer_fields = {}
+        for field in writer.get("fields", []):
+            writer_fields[field["name"]] = field
+        errors = []
+        for field in reader.get("fields", []):
+            field_path = f"{path}.{field['name']}" if path else field["name"]
+            names = [field["name"]] + field.get("aliases", [])
+            matching = [writer_fields[x] for x in names if x in writer_fields]
+            if matching:
+                errors += self.check(field["type"], matching[0]["type"], field_path)
+            elif "default" not in field:
+                errors.append(
+                    f"{field_path}: reader field has no default and is missing "
+                    f"from the writer schema"
+                )
+        return errors
+
+
+def check_can_read(reader_str: str, writer_str: str) -> List[str]:
+    """
+    Check that data written with writer_str can be read with reader_str.
+    Returns a list of reasons why not (empty if compatible)
+    """
+    try:
+        reader = _Schema(reader_str)
+        writer = _Schema(writer_str)
+        return _Checker(reader, writer).check(reader.schema, writer.schema, "")
+    except (KeyError, TypeError, AttributeError) as e:
+        # Missing or mistyped attributes (a record without name, an array
+        # without items...)
+        raise AvroSchemaError(f"Malformed schema: {e!r}")
+
+
+def check_compatibility(
+    new_schema: str, previous_schemas: List[str], level: str
+) -> List[str]:
+    """
+    Check a new schema against previous versions (oldest first) according to
+    a Schema Registry compatibility level. Non transitive levels only check
+    against the latest version.
+    Returns a list of reasons why the new schema is incompatible
+    """
+    level = (level or "none").lower()
+    if level == "none" or not previous_schemas:
+        return []
+    if not level.endswith("_transitive"):
+        previous_schemas = previous_schemas[-1:]
+    errors = []
+    for index, previous in enumerate(previous_schemas):
+        label = "latest" if index == len(previous_schemas) - 1 else f"v{index + 1}"
+        if level.startswith("backward") or level.startswith("full"):
+            for reason in check_can_read(new_schema, previous):
+                errors.append(f"BACKWARD with {label}: {reason}")
+        if level.startswith("forward") or level.startswith("full"):
+            for reason in check_can_read(previous, new_schema):
+                errors.append(f"FORWARD with {label}: {reason}")
+    return errors
@@ -0,0 +1,139 @@
+from typing import List
+
+# Trie key marking the end of a prefix. Resource names never contain an
+# empty character so it can't clash with a child
+END = ""
+
+
+class PrefixTrie(object):
+    """
+    Trie of the resource name prefixes of PREFIXED rolebindings
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, prefix: str):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[END] = prefix
+
+    def iter_prefixes(self, name: str, proper=False):
+        """
+        Yield the prefixes in the trie that name starts with, shortest first
+        :proper only yield prefixes shorter than name
+        """
+        node = self.root
+        for char in name:
+            if END in node:
+                yield node[END]
+            node = node.get(char, None)
+            if node is None:
+                return
+        if not proper and END in node:
+            yield node[END]
+
+    def find_prefix(self, name: str, proper=False):
+        """
+        Return the shortest prefix in the trie that name starts with, or None.
+        :proper only return prefixes shorter than name
+        """
+        return next(self.iter_prefixes(name, proper=proper), None)
+
+
+def minimize_bindings(bindings: List[tuple], covering=None):
+    """
+    Drop duplicate rolebindings and rolebindings covered by a broader
+    PREFIXED rolebinding of the same principal, role, resource type and
+    scope.
+    :bindings list of (scope, principal, role, resourceType, name,
+    patternType) tuples. The scope can be any hashable value.
+    :covering optional list of rolebindings that already exist. Their
+    PREFIXED rolebindings cover bindings too, but they are not returned
+    Returns a tuple (kept, collapsed). kept is the list of remaining
+    bindings in input order and collapsed a list of (binding, prefix) of the
+    dropped bindings with the prefix covering them
+    """
+    unique = list(dict.fromkeys(bindings))
+    # {(scope, principal, role, resourceType): PrefixTrie}
+    tries = {}
+    for binding in unique + list(covering or []):
+        if binding[5] == "PREFIXED":
+            tries.setdefault(binding[:4], PrefixTrie()).add(binding[4])
+    kept = []
+    collapsed = []
+    for binding in unique:
+        trie = tries.get(binding[:4], None)
+        prefix = None
+        if trie:
+            prefix = trie.find_prefix(binding[4], proper=binding[5] == "PREFIXED")
+        if prefix is None:
+            kept.append(binding)
+        else:
+            collapsed.append((binding, prefix))
+    return (kept, collapsed)
+
+
+class BindingIndex(object):
+    """
+    In-memory index of rolebindings to answer which principals have access
+    to a resource and which resources a principal has access to.
+    Lookups by resource walk a prefix trie per resource type, so they cost
+    the length of the resource name and not the number of bindings.
+
+    Bindings are (scope, principal, role, resourceType, name, patternType)
+    tuples, as in minimize_bindings. Each binding records the sources it
+    came from (e.g. declared and live)
+    """
+
+    def __init__(self):
+        # {binding: set of sources}
+        self.sources = {}
+        # {principal: [binding]}
+        self.by_principal = {}
+        # {(resourceType, name): [binding]} of LITERAL bindings
+        self.literal = {}
+        # {(resourceType, prefix): [binding]} of PREFIXED bindings
+        self.prefixed = {}
+        # {resourceType: PrefixTrie} of the prefixes in self.prefixed
+        self.tries = {}
+
+    def __len__(self):
+        return len(self.sources)
+
+    def add(self, binding: tuple, source: str):
+        """
+        Add a binding seen in source
+        """
+        if binding in self.sources:
+            self.sources[binding].add(source)
+            return
+        self.sources[binding] = {source}
+        scope, principal, role, resource_type, name, pattern_type = binding
+        self.by_principal.setdefault(principal, []).append(binding)
+        if pattern_type == "PREFIXED":
+            key = (resource_type, name)
+            if key not in self.prefixed:
+                self.tries.setdefault(resource_type, PrefixTrie()).add(name)
+            self.prefixed.setdefault(key, []).append(binding)
+        else:
+            self.literal.setdefault((resource_type, name), []).append(binding)
+
+    def get_principal_bindings(self, principal: str):
+        """
+        Return the bindings of principal
+        """
+        return list(self.by_principal.get(principal, []))
+
+    def get_resource_bindings(self, resource_type: str, name: str):
+        """
+        Return the bindings granting access to the resource named name,
+        literally or through a prefix
+        """
+        result = list(self.literal.get((resource_type, name), []))
+        trie = self.tries.get(resource_type, None)
+        if trie:
+            for prefix in trie.iter_prefixes(name):
+                result.extend(self.prefixed[(resource_type, prefix)])
+        return result
@@ -2,15 +2,20 @@
 # from alladmin import AllAdmin
 from kafkalo.topics import KafkaAdmin
 from kafkalo.schemas import SchemaAdmin
+from kafkalo.schema_cache import SchemaFingerprintCache
 from kafkalo.inputparser import InputParser
 from kafkalo.config import Config
 from kafkalo.clients import MDSAdmin
 from kafkalo.report import Report
+from kafkalo.reassignment import load_partition_sizes
+from kafkalo.state import StateStore
 import click
+from concurrent.futures import ThreadPoolExecutor
 from confluent_kafka.admin import AdminClient
 from confluent_kafka.schema_registry import SchemaRegistryClient
 from pathlib import Path
 from kafkalo.cli_schema import schema as schema_group
+from kafkalo.cli_access import access
 
 
 @click.group()
@@ -30,34 +35,204 @@ def cli():
     required=True,
     help="Config yaml file for kafkalo",
 )
-def sync(dry_run, config):
+@click.option(
+    "--reassignment-dir",
+    default=None,
+    help="Write replication factor change reassignments to this directory",
+)
+@click.option(
+    "--log-dirs-file",
+    default=None,
+    help="Output of kafka-log-dirs.sh --describe (as printed, or only its JSON "
+    "line) to estimate bytes moved",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Verify all resources, even those unchanged since the last sync",
+)
+@click.option(
+    "--since",
+    default=None,
+    help="Only reconcile resources from YAML files changed since this git ref",
+)
+@click.option(
+    "--parallel",
+    is_flag=True,
+    default=False,
+    help="Reconcile topics and schemas concurrently; rolebindings after topics",
+)
+def sync(dry_run, config, reassignment_dir, log_dirs_file, full, since, parallel):
     """
     Synchronize Kafka config to YAML files
     """
     configuration = Config(filename=config)
     topic_admin, schema_admin, mds_admin = get_admin_clients(configuration)
-    # Reconcile topics
-    parser = InputParser(configuration.get_input_patterns())
-    topic_admin.reconcile_topics(parser.get_topics(), dry_run=dry_run)
+    if log_dirs_file:
+        topic_admin.partition_sizes = load_partition_sizes(log_dirs_file)
+    state = None
+    if configuration.get_state_file():
+        state = StateStore(
+            configuration.get_state_file(), ttl=configuration.get_state_ttl()
+        )
+    chunk_size = configuration.get_stream_chunk_size()
+    parser = InputParser(
+        configuration.get_input_patterns(),
+        since=since,
+        streaming=bool(chunk_size),
+        workers=configuration.get_parse_workers(),
+        cache_dir=configuration.get_parse_cache_dir(),
+    )
+    if chunk_size:
+        # Read and reconcile the input in chunks to bound memory use
+        batches = parser.iter_chunks(chunk_size)
+        subjects = None
+    else:
+        batches = [(parser.get_topics(), parser.get_schemas(), parser.get_clients())]
+        subjects = [x.subject_name for x in batches[0][1] or []]
+    if configuration.get_schema_snapshot():
+        # Loaded once for all batches. When streaming, the subjects are not
+        # known upfront so every subject under the prefixes is kept
+        schema_admin.load_snapshot(
+            configuration.get_schema_snapshot_prefixes(), subjects=subjects
+        )
+    for topics, schemas, clients in batches:
+        sync_batch(
+            topic_admin,
+            schema_admin,
+            mds_admin,
+            state,
+            topics,
+            schemas,
+            clients,
+            dry_run=dry_run,
+            full=full,
+            parallel=parallel,
+        )
     topics_context = topic_admin.get_dry_run_plan()
-    # Reconcile schemas
-    schemas = parser.get_schemas()
-    schema_admin.reconcile_schemas(schemas, dry_run=dry_run)
+    # No planner if no topics were reconciled (e.g. empty streaming input)
+    planner = topic_admin.reassignment_planner
+    reassignment_context = planner.get_summary() if planner else None
+    if reassignment_dir and planner:
+        write_reassignment_waves(planner, reassignment_dir)
     schema_context = schema_admin.get_dry_run_plan()
-
-    # TODO no reconcile yet for Clients...
-    # mds_admin.do_consumer_for("SKATA", "arcanum")
-    mds_admin.reconcile_roles(parser.get_clients(), dry_run=dry_run)
+    schema_admin.cache.save()
+    if state and not dry_run:
+        state.save()
     if dry_run:
         client_context = mds_admin.get_dry_run_plan()
         report = Report(
             client_context=client_context,
             schema_context=schema_context,
             topics_context=topics_context,
+            reassignment_context=reassignment_context,
         )
         print(report.render())
 
 
+def sync_batch(
+    topic_admin,
+    schema_admin,
+    mds_admin,
+    state,
+    topics,
+    schemas,
+    clients,
+    dry_run=False,
+    full=False,
+    parallel=False,
+):
+    """
+    Reconcile a batch of resources and record the ones applied in the state
+    """
+    # Only reconcile resources that changed since the last successful sync
+    if state and not full:
+        topics = state.filter_changed(StateStore.TOPICS, topics)
+        schemas = state.filter_changed(StateStore.SCHEMAS, schemas)
+        clients = state.filter_changed(StateStore.CLIENTS, clients)
+    schemas_failed = reconcile_all(
+        topic_admin,
+        schema_admin,
+        mds_admin,
+        topics,
+        schemas,
+        clients,
+        dry_run=dry_run,
+        parallel=parallel,
+    )
+    if state and not dry_run:
+        failed_topics = topic_admin.get_failed_topic_names()
+        state.record(
+            StateStore.TOPICS, [x for x in topics if x.name not in failed_topics]
+        )
+        state.record(
+            StateStore.SCHEMAS,
+            [x for x in schemas if x.subject_name not in schemas_failed],
+        )
+        state.record(
+            StateStore.CLIENTS,
+            [
+                x
+                for x in clients or []
+                if x.principal not in mds_admin.failed_principals
+            ],
+        )
+
+
+def reconcile_all(
+    topic_admin,
+    schema_admin,
+    mds_admin,
+    topics,
+    schemas,
+    clients,
+    dry_run=False,
+    parallel=False,
+):
+    """
+    Reconcile topics, schemas and rolebindings.
+    In parallel mode the schema registry is reconciled while topics are,
+    since they are independent. Rolebindings refer to topics so they always
+    run after the topics are reconciled.
+    Returns the schemas that failed to register
+    """
+    if not parallel:
+        topic_admin.reconcile_topics(topics, dry_run=dry_run)
+        registered, schemas_failed = schema_admin.reconcile_schemas(
+            schemas, dry_run=dry_run
+        )
+        mds_admin.reconcile_roles(clients, dry_run=dry_run)
+        return schemas_failed
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        topics_future = executor.submit(
+            topic_admin.reconcile_topics, topics, dry_run=dry_run
+        )
+        schemas_future = executor.submit(
+            schema_admin.reconcile_schemas, schemas, dry_run=dry_run
+        )
+        topics_future.result()
+        mds_admin.reconcile_roles(clients, dry_run=dry_run)
+        registered, schemas_failed = schemas_future.result()
+    return schemas_failed
+
+
+def write_reassignment_waves(planner, directory):
+    """
+    Write the reassignment waves and print how to execute them
+    """
+    filenames = planner.write_waves(directory)
+    throttle = ""
+    if planner.throttle:
+        throttle = f" --throttle {planner.throttle}"
+    for filename in filenames:
+        print(
+            f"Run: kafka-reassign-partitions.sh --bootstrap-server <brokers> "
+            f"--reassignment-json-file {filename} --execute{throttle} "
+            f"and wait for --verify to complete before the next wave"
+        )
+
+
 @click.command()
 @click.pass_context
 @click.option(
@@ -65,11 +240,48 @@ def sync(dry_run, config):
     required=True,
     help="Config yaml file for kafkalo",
 )
-def plan(ctx, config):
+@click.option(
+    "--reassignment-dir",
+    default=None,
+    help="Write replication factor change reassignments to this directory",
+)
+@click.option(
+    "--log-dirs-file",
+    default=None,
+    help="Output of kafka-log-dirs.sh --describe (as printed, or only its JSON "
+    "line) to estimate bytes moved",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Verify all resources, even those unchanged since the last sync",
+)
+@click.option(
+    "--since",
+    default=None,
+    help="Only reconcile resources from YAML files changed since this git ref",
+)
+@click.option(
+    "--parallel",
+    is_flag=True,
+    default=False,
+    help="Reconcile topics and schemas concurrently; rolebindings after topics",
+)
+def plan(ctx, config, reassignment_dir, log_dirs_file, full, since, parallel):
     """
     Generate a plan. This is equivalent to sync --dry-run
     """
-    ctx.invoke(sync, dry_run=True, config=config)
+    ctx.invoke(
+        sync,
+        dry_run=True,
+        config=config,
+        reassignment_dir=reassignment_dir,
+        log_dirs_file=log_dirs_file,
+        full=full,
+        since=since,
+        parallel=parallel,
+    )
 
 
 def get_admin_clients(config):
@@ -77,10 +289,27 @@ def get_admin_clients(config):
     kafka_config = config.get_kafka_config()
     adminclient = AdminClient(kafka_config)
     consumer = AdminClient(kafka_config)
-    topic_admin = KafkaAdmin(adminclient, consumer)
+    topic_admin = KafkaAdmin(
+        adminclient,
+        consumer,
+        batch_size=config.get_batch_size(),
+        incremental=config.get_incremental_alter_configs(),
+        delete_unmanaged_configs=config.get_delete_unmanaged_configs(),
+        balanced_placement=config.get_balanced_placement(),
+        reassignment_wave_size=config.get_reassignment_wave_size(),
+        reassignment_throttle=config.get_reassignment_throttle(),
+    )
 
     sr_client = SchemaRegistryClient(config.get_sr_config())
-    schema_admin = SchemaAdmin(sr_client)
+    schema_cache = SchemaFingerprintCache(
+        config.get_schema_cache_file(), registry_url=config.get_sr_config()["url"]
+    )
+    schema_admin = SchemaAdmin(
+        sr_client,
+        max_workers=config.get_schema_registry_workers(),
+        cache=schema_cache,
+        compat_check=config.get_schema_compat_check(),
+    )
     mds_admin = MDSAdmin(config.get_mds_config())
     return (topic_admin, schema_admin, mds_admin)
 
@@ -88,6 +317,7 @@ def get_admin_clients(config):
 cli.add_command(sync)
 cli.add_command(plan)
 cli.add_command(schema_group)
+cli.add_command(access)
 
 
 def main():
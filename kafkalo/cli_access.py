@@ -0,0 +1,113 @@
+import click
+import json
+import sys
+from contextlib import redirect_stdout
+from kafkalo.config import Config
+from kafkalo.inputparser import InputParser
+from kafkalo.clients import MDSAdmin, RoleBindingPlanner
+from kafkalo.bindings import BindingIndex
+
+# Names of the MDS contexts in the output
+CONTEXT_NAMES = {
+    RoleBindingPlanner.CTX_KAFKA: "kafka",
+    RoleBindingPlanner.CTX_SR: "schema-registry",
+    RoleBindingPlanner.CTX_KSQL: "ksql",
+    RoleBindingPlanner.CTX_CONNECT: "connect",
+}
+
+
+def build_index(clients, mds_admin=None, principals=None):
+    """
+    Build a BindingIndex of the rolebindings of the declared clients.
+    :clients a list of Client objects
+    :mds_admin if set, add the live rolebindings of the declared principals
+    (and of principals) from MDS
+    :principals extra principals to lookup in MDS
+    """
+    index = BindingIndex()
+    planner = RoleBindingPlanner()
+    planner.queue_roles(clients or [])
+    for binding in planner.desired_bindings:
+        index.add(binding, "declared")
+    if mds_admin:
+        lookup = set(index.by_principal) | set(principals or [])
+        mds_admin.load_rolebindings(
+            sorted(lookup), (MDSAdmin.CTX_KAFKA, MDSAdmin.CTX_SR)
+        )
+        for (_, ctx), bindings in mds_admin.bindings.items():
+            for binding in bindings:
+                index.add((ctx,) + binding, "live")
+    return index
+
+
+def binding_to_dict(index, binding):
+    scope, principal, role, resource_type, name, pattern_type = binding
+    return {
+        "principal": principal,
+        "role": role,
+        "resourceType": resource_type,
+        "name": name,
+        "patternType": pattern_type,
+        "scope": CONTEXT_NAMES.get(scope, scope),
+        "sources": sorted(index.sources[binding]),
+    }
+
+
+@click.command()
+@click.option("--config", required=True, help="Config yaml file for kafkalo")
+@click.option("--principal", default=None, help="List the resources of principal")
+@click.option(
+    "--resource", default=None, help="List the principals with access to resource"
+)
+@click.option(
+    "--resource-type",
+    default="Topic",
+    help="Type of --resource (Topic, Subject, Group)",
+)
+@click.option(
+    "--live",
+    is_flag=True,
+    default=False,
+    help="Include the existing rolebindings of the declared principals from MDS",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output JSON")
+def access(config, principal, resource, resource_type, live, as_json):
+    """
+    Show the effective rolebindings of a principal or of a resource
+    """
+    if bool(principal) == bool(resource):
+        raise click.UsageError("Use exactly one of --principal or --resource")
+    # Diagnostics of the parser and MDS lookups go to stderr so that only
+    # the result is written to stdout (e.g. for --json)
+    with redirect_stdout(sys.stderr):
+        configuration = Config(filename=config)
+        parser = InputParser(
+            configuration.get_input_patterns(),
+            workers=configuration.get_parse_workers(),
+            cache_dir=configuration.get_parse_cache_dir(),
+        )
+        mds_admin = None
+        if live:
+            mds_admin = MDSAdmin(configuration.get_mds_config())
+        index = build_index(
+            parser.get_clients(),
+            mds_admin=mds_admin,
+            principals=[principal] if principal else None,
+        )
+    if principal:
+        bindings = index.get_principal_bindings(principal)
+    else:
+        bindings = index.get_resource_bindings(resource_type, resource)
+    result = [binding_to_dict(index, x) for x in bindings]
+    result.sort(key=lambda x: (x["principal"], x["scope"], x["name"], x["role"]))
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+        return
+    if not result:
+        click.echo("No rolebindings found")
+    for item in result:
+        click.echo(
+            f"{item['principal']} {item['role']} on {item['resourceType']} "
+            f"{item['name']} ({item['patternType']}) in {item['scope']} "
+            f"[{', '.join(item['sources'])}]"
+        )
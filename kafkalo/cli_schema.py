@@ -1,6 +1,7 @@
 import click
 from kafkalo.config import Config
 from confluent_kafka.schema_registry import SchemaRegistryClient
+from confluent_kafka.schema_registry.error import SchemaRegistryError
 from kafkalo.schemas import SchemaAdmin, Schema
 
 
@@ -23,6 +24,18 @@ def check_exists(subject, schema_file, config):
     schema_admin = SchemaAdmin(sr_client)
     with open(schema_file, "r") as fp:
         schema = Schema(subject, fp.read())
+        # Answer from the latest version if it matches, otherwise lookup all
+        # versions
+        try:
+            schema_admin.load_snapshot([subject], subjects=[subject])
+        except SchemaRegistryError as e:
+            print(f"Failed to load schema snapshot ({e}). Falling back to lookup")
+        latest = (schema_admin.snapshot or {}).get(subject, None)
+        if latest and latest.fingerprint == schema.fingerprint:
+            print(
+                f"Schema found: SUBJECT: {subject}, ID:{latest.schema_id} VERSION: {latest.version}"  # noqa: E501
+            )
+            return
         success, response = schema_admin.lookup_schema(schema)
         if success:
             print(
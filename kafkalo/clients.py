@@ -1,5 +1,8 @@
+import sys
 from typing import List
-import requests
+from kafkalo.transport import MDSTransport
+from kafkalo.utils import chunks
+from kafkalo.bindings import minimize_bindings
 
 
 class Client(object):
@@ -25,9 +28,13 @@ class Client(object):
         self.groups = groups
 
 
-class MDSAdmin(object):
+class RoleBindingPlanner(object):
     """
-    Manage schema registry
+    Map clients to the rolebindings they need. Doesn't talk to MDS so the
+    desired rolebindings can be computed offline.
+    The do_* methods and queue_roles only queue rolebindings in
+    desired_bindings. Nothing is sent until MDSAdmin.apply_rolebindings is
+    called (reconcile_roles does both)
     """
 
     # Context names
@@ -36,29 +43,10 @@ class MDSAdmin(object):
     CTX_KSQL = 3  # KSQLDB
     CTX_CONNECT = 4  # Connect
 
-    def __init__(self, mds_config):
-        self.mds_config = mds_config
-        self.url = mds_config["url"]
-        self.auth = (mds_config["username"], mds_config["password"])
-        self.kafka_cluster_id = self.get_kafka_cluster_id()
-        self.schema_registry_cluster_id = mds_config.get(
-            "schema-registry-cluster-id", None
-        )
-        self.connect_cluster_id = mds_config.get("connect-cluster-id", None)
-        self.ksql_cluster_id = mds_config.get("ksql-cluster-id", None)
-        # If dry_run is enabld then each method that actually modifies
-        # resources will record its plan in this data structure. We can then
-        # use this to present a nice plan to the user (for example with a
-        # Jinja2 template)
-        self.dry_run_plan = {"rolebindings": []}
-        self.resource_types = ("Topic", "Group", "Cluster", "Subject")
-
-    def get_dry_run_plan(self):
-        return self.dry_run_plan
-
-    def get_kafka_cluster_id(self):
-        r = requests.get(self.url + "/security/1.0/metadataClusterId", auth=self.auth)
-        return r.text
+    def __init__(self):
+        # Desired rolebindings queued by _set_rolebinding, in order:
+        # {(ctx, principal, role, resourceType, name, patternType): None}
+        self.desired_bindings = {}
 
     def _set_rolebinding(
         self,
@@ -68,99 +56,67 @@ class MDSAdmin(object):
         principal: str,
         roles: list,
         prefixed=True,
-        dry_run=False,
     ):
         """
-        Set the rolebindings listed in rolebindings for the given principal and
-        resource type.
-        :ctx context (Kafka, schema registry etc. as defined in MDSAdmin.CTX_*)
+        Queue the rolebindings listed in rolebindings for the given principal
+        and resource type. Queued rolebindings are sent by
+        MDSAdmin.apply_rolebindings.
+        :ctx context (Kafka, schema registry etc. as defined in CTX_*)
         :resource_type Topic,Group,Cluster etc
         :resource_name the name of the resource. (name of topic or subject)
         :principal the principal name.
         :roles a list of role nmes
         :prefixed Use prefixed rolebinding (defaults to true)
-        :dry_run don't change but record in dry_run_plan
         """
 
-        context = self._get_context(ctx)
         patternType = "PREFIXED"
         if not prefixed:
             patternType = "LITERAL"
-        data = {
-            "scope": context,
-            "resourcePatterns": [
-                {
-                    "resourceType": resource_type,
-                    "name": resource_name,
-                    "patternType": patternType,
-                }
-            ],
-        }
         for roleName in roles:
-            if not dry_run:
-                try:
-                    r = requests.post(
-                        self.url
-                        + f"/security/1.0/principals/{principal}/roles/{roleName}/bindings",  # noqa: E501
-                        auth=self.auth,
-                        json=data,
-                    )
-                    r.raise_for_status()
-                except Exception as e:
-                    print(
-                        f"Failed to set RBAC {roleName} for {principal} with error {e.text}"  # noqa: E501
-                    )
-            else:
-                data["principal"] = principal
-                data["role"] = roleName
-                # TODO either don't add if already exists or add metadata so
-                # that we can only display rolebindings to be created only
-                self.dry_run_plan["rolebindings"].append(data.copy())
+            binding = (ctx, principal, roleName, resource_type, resource_name)
+            self.desired_bindings[binding + (patternType,)] = None
 
-    def do_consumer_for(self, topic, principal, prefixed=True, dry_run=False):
+    def do_consumer_for(self, topic, principal, prefixed=True):
         """
-        Convenience method that assigns a set of permisions for a typical
-        reader client
+        Convenience method that queues a set of permisions for a typical
+        reader client. Queued rolebindings must be applied with
+        apply_rolebindings
         """
         consumer_roles = ["DeveloperRead"]
         self._set_rolebinding(
-            MDSAdmin.CTX_KAFKA,
+            RoleBindingPlanner.CTX_KAFKA,
             "Topic",
             topic,
             principal,
             consumer_roles,
             prefixed,
-            dry_run=dry_run,
         )
         # add schema registry roles
         self._set_rolebinding(
-            MDSAdmin.CTX_SR,
+            RoleBindingPlanner.CTX_SR,
             "Subject",
             topic,
             principal,
             consumer_roles,
             prefixed,
-            dry_run=dry_run,
         )
 
-    def do_producer_for(
-        self, topic, principal, prefixed=True, strict=False, dry_run=False
-    ):
+    def do_producer_for(self, topic, principal, prefixed=True, strict=False):
         """
-        Convenience method that assigns a set of permisions for a typical
-        producer client
+        Convenience method that queues a set of permisions for a typical
+        producer client. Queued rolebindings must be applied with
+        apply_rolebindings
         :strict strict mode meant for production environments. give write to topic but only
         read on schema registry
         """
         roles = ["DeveloperWrite"]
         self._set_rolebinding(
-            MDSAdmin.CTX_KAFKA,
+            RoleBindingPlanner.CTX_KAFKA,
             "Topic",
             topic,
             principal,
             roles,
             prefixed,
-            dry_run=dry_run,
         )
         sr_roles = ["DeveloperRead"]
         # If stict mode is set, don't allow develerWrite on the schema
@@ -168,102 +124,61 @@ class MDSAdmin(object):
         if not strict:
             sr_roles.append("DeveloperWrite")
         self._set_rolebinding(
-            MDSAdmin.CTX_SR,
+            RoleBindingPlanner.CTX_SR,
             "Subject",
             topic,
             principal,
             sr_roles,
             prefixed,
-            dry_run=dry_run,
         )
 
-    def do_resourceowner_for(self, topic, principal, prefixed=True, dry_run=False):
+    def do_resourceowner_for(self, topic, principal, prefixed=True):
         """
-        Convenience method that assigns a set of permissions for a
-        resourceowner. (read/write AND delegate)
+        Convenience method that queues a set of permissions for a
+        resourceowner. (read/write AND delegate). Queued rolebindings must be
+        applied with apply_rolebindings
         """
         roles = ["ResourceOwner"]
         self._set_rolebinding(
-            MDSAdmin.CTX_KAFKA,
+            RoleBindingPlanner.CTX_KAFKA,
             "Topic",
             topic,
             principal,
             roles,
             prefixed,
-            dry_run=dry_run,
         )
         # add schema registry roles
         self._set_rolebinding(
-            MDSAdmin.CTX_SR,
+            RoleBindingPlanner.CTX_SR,
             "Subject",
             topic,
             principal,
             roles,
             prefixed,
-            dry_run=dry_run,
-        )
-
-    def _get_context(self, ctx):
-        """
-        Generate a context dict suitable to be used as param for MDS API
-        :ctx the context type (schema registry, kafka etc) as defined in MDSAdmin.CTX_*
-        """
-        context = {
-            "clusters": {
-                "kafka-cluster": self.kafka_cluster_id,
-            },
-        }
-        if ctx == MDSAdmin.CTX_KAFKA:
-            return context
-        if ctx == MDSAdmin.CTX_SR:
-            context["clusters"][
-                "schema-registry-cluster"
-            ] = self.schema_registry_cluster_id
-            return context
-        if ctx == MDSAdmin.CTX_KSQL:
-            context["clusters"]["ksql-cluster"] = self.ksql_cluster_id
-            return context
-        if ctx == MDSAdmin.CTX_CONNECT:
-            context["clusters"]["connect-cluster"] = self.connectl_cluster_id
-            return context
-
-    def get_rolebinding_for_user(self, username):
-        data = self._get_context(MDSAdmin.CTX_KAFKA)
-        r = requests.post(
-            self.url + f"/security/1.0/lookup/principals/{username}/roleNames",
-            auth=self.auth,
-            json=data,
         )
-        result = r.json()
-        print(f"rolebinding list: {result}")
-        return r.json()
 
-    def do_group(self, name, principal, prefixed=True, roles=None, dry_run=False):
+    def do_group(self, name, principal, prefixed=True, roles=None):
         """
-        Add consumer group rolebindings
+        Queue consumer group rolebindings. Queued rolebindings must be
+        applied with apply_rolebindings
         """
         if not roles:
             roles = ["DeveloperRead"]
         self._set_rolebinding(
-            MDSAdmin.CTX_KAFKA,
+            RoleBindingPlanner.CTX_KAFKA,
             "Group",
             name,
             principal,
             roles,
             prefixed=prefixed,
-            dry_run=dry_run,
         )
 
-    def reconcile_roles(self, clients: List[Client], dry_run=False):
+    def queue_roles(self, clients: List[Client]):
         """
-        Iterate over Client list and reconcile current with desired
-        configuration
+        Queue the rolebindings of the clients in desired_bindings. Queued
+        rolebindings must be applied with apply_rolebindings
         :clients a list of Client objects
-        :dry_run Don't change anything but display what would change (and
-        validate if possible)
         """
-        if not clients:
-            return
         for client in clients:
             principal = client.principal
             if client.consumer_for:
@@ -272,7 +187,6 @@ class MDSAdmin(object):
                         topic=topic["topic"],
                         principal=principal,
                         prefixed=topic.get("prefixed", True),
-                        dry_run=dry_run,
                     )
             if client.producer_for:
                 for topic in client.producer_for:
@@ -281,7 +195,6 @@ class MDSAdmin(object):
                         principal=principal,
                         prefixed=topic.get("prefixed", True),
                         strict=topic.get("strict", False),
-                        dry_run=dry_run,
                     )
             if client.resourceowner_for:
                 for topic in client.resourceowner_for:
@@ -289,7 +202,6 @@ class MDSAdmin(object):
                         topic=topic["topic"],
                         principal=principal,
                         prefixed=topic.get("prefixed", True),
-                        dry_run=dry_run,
                     )
             if client.groups:
                 for group in client.groups:
@@ -298,5 +210,238 @@ class MDSAdmin(object):
                         principal=principal,
                         prefixed=group.get("prefixed", True),
                         roles=group.get("roles", ["DeveloperRead"]),
-                        dry_run=dry_run,
                     )
+
+
+class MDSAdmin(RoleBindingPlanner):
+    """
+    Manage rolebindings in MDS
+    """
+
+    def __init__(self, mds_config, transport=None):
+        """
+        :mds_config the mds connection config
+        :transport the MDSTransport used for all MDS calls. Created from
+        mds_config if None
+        """
+        super().__init__()
+        self.mds_config = mds_config
+        self.url = mds_config["url"]
+        self.transport = transport or MDSTransport.from_config(mds_config)
+        self.kafka_cluster_id = self.get_kafka_cluster_id()
+        self.schema_registry_cluster_id = mds_config.get(
+            "schema-registry-cluster-id", None
+        )
+        self.connect_cluster_id = mds_config.get("connect-cluster-id", None)
+        self.ksql_cluster_id = mds_config.get("ksql-cluster-id", None)
+        # If dry_run is enabld then each method that actually modifies
+        # resources will record its plan in this data structure. We can then
+        # use this to present a nice plan to the user (for example with a
+        # Jinja2 template)
+        self.dry_run_plan = {"rolebindings": [], "collapsed_rolebindings": []}
+        # Principals for which at least one rolebinding failed
+        self.failed_principals = set()
+        # Existing rolebindings of managed principals by principal and
+        # context: {(principal, ctx): {(principal, role, resourceType, name,
+        # patternType)}}
+        self.bindings = {}
+        # (principal, ctx) pairs whose bindings were loaded into bindings
+        self.loaded_bindings = set()
+        # (ctx, binding tuple) of rolebindings already in the dry run plan
+        self.planned_bindings = set()
+        # (ctx, binding tuple) of rolebindings already reported as collapsed
+        self.collapsed_bindings = set()
+        # Max number of resource patterns sent in a single request
+        self.bindings_per_request = int(mds_config.get("bindings-per-request", 100))
+        self.resource_types = ("Topic", "Group", "Cluster", "Subject")
+
+    def get_dry_run_plan(self):
+        return self.dry_run_plan
+
+    def get_kafka_cluster_id(self):
+        r = self.transport.get("/security/1.0/metadataClusterId")
+        return r.text
+
+    def _load_bindings(self, principal: str, ctx):
+        """
+        Load the existing rolebindings of principal in a context into
+        self.bindings. Each principal and context is only looked up once.
+        Bindings the principal gets through its groups are not included
+        """
+        if (principal, ctx) in self.loaded_bindings:
+            return
+        self.loaded_bindings.add((principal, ctx))
+        index = self.bindings.setdefault((principal, ctx), set())
+        try:
+            r = self.transport.post(
+                f"/security/1.0/lookup/principal/{principal}/resources",
+                json=self._get_context(ctx),
+            )
+            r.raise_for_status()
+            result = r.json() or {}
+        except Exception as e:
+            # Without the existing bindings, all bindings are set
+            print(
+                f"Failed to get rolebindings of {principal} with error {e}",
+                file=sys.stderr,
+            )
+            return
+        for role, patterns in result.get(principal, {}).items():
+            for pattern in patterns:
+                index.add(
+                    (
+                        principal,
+                        role,
+                        pattern["resourceType"],
+                        pattern["name"],
+                        pattern["patternType"],
+                    )
+                )
+
+    def load_rolebindings(self, principals, contexts):
+        """
+        Load the existing rolebindings of principals in each of the contexts
+        into self.bindings
+        """
+        for principal in principals:
+            for ctx in contexts:
+                self._load_bindings(principal, ctx)
+
+    def has_rolebinding(self, ctx, principal, role, resource_type, name, pattern_type):
+        """
+        True if the rolebinding already exists
+        """
+        self._load_bindings(principal, ctx)
+        binding = (principal, role, resource_type, name, pattern_type)
+        return binding in self.bindings[(principal, ctx)]
+
+    def _plan_rolebindings(self, dry_run=False):
+        """
+        Minimize the queued rolebindings and return the missing ones grouped
+        by principal, role and context:
+        {(principal, role, ctx): {binding tuple: resourcePattern}}
+        Rolebindings covered by a broader prefixed rolebinding, queued or
+        already existing in MDS (or planned, in dry run), are recorded in the
+        plan as collapsed.
+        """
+        desired = list(self.desired_bindings)
+        self.desired_bindings = {}
+        covering = []
+        for principal, ctx in dict.fromkeys((x[1], x[0]) for x in desired):
+            self._load_bindings(principal, ctx)
+            covering += [(ctx,) + x for x in self.bindings[(principal, ctx)]]
+        if dry_run:
+            covering += [(ctx,) + x for ctx, x in self.planned_bindings]
+        kept, collapsed = minimize_bindings(desired, covering=covering)
+        for binding, prefix in collapsed:
+            if binding in self.collapsed_bindings:
+                continue
+            self.collapsed_bindings.add(binding)
+            ctx, principal, role, resource_type, name, pattern_type = binding
+            self.dry_run_plan["collapsed_rolebindings"].append(
+                {
+                    "principal": principal,
+                    "role": role,
+                    "resourceType": resource_type,
+                    "name": name,
+                    "patternType": pattern_type,
+                    "covered_by": prefix,
+                }
+            )
+        pending = {}
+        for ctx, *binding in kept:
+            binding = tuple(binding)
+            if self.has_rolebinding(ctx, *binding):
+                continue
+            if dry_run and (ctx, binding) in self.planned_bindings:
+                continue
+            principal, role, resource_type, name, pattern_type = binding
+            pending.setdefault((principal, role, ctx), {})[binding] = {
+                "resourceType": resource_type,
+                "name": name,
+                "patternType": pattern_type,
+            }
+        return pending
+
+    def apply_rolebindings(self, dry_run=False):
+        """
+        Send the queued rolebindings that don't exist yet and are not
+        covered by a broader prefixed rolebinding. Resource patterns of the
+        same principal, role and context are sent together, in requests of
+        at most bindings_per_request patterns.
+        :dry_run don't change but record in dry_run_plan
+        """
+        pending = self._plan_rolebindings(dry_run=dry_run)
+        for (principal, roleName, ctx), patterns in pending.items():
+            for chunk in chunks(list(patterns.items()), self.bindings_per_request):
+                data = {
+                    "scope": self._get_context(ctx),
+                    "resourcePatterns": [pattern for _, pattern in chunk],
+                }
+                if dry_run:
+                    data["principal"] = principal
+                    data["role"] = roleName
+                    self.dry_run_plan["rolebindings"].append(data)
+                    self.planned_bindings.update((ctx, x) for x, _ in chunk)
+                    continue
+                try:
+                    r = self.transport.post(
+                        f"/security/1.0/principals/{principal}/roles/{roleName}/bindings",  # noqa: E501
+                        json=data,
+                    )
+                    r.raise_for_status()
+                    self.bindings.setdefault((principal, ctx), set()).update(
+                        binding for binding, _ in chunk
+                    )
+                except Exception as e:
+                    self.failed_principals.add(principal)
+                    print(
+                        f"Failed to set RBAC {roleName} for {principal} with error {e}"
+                    )
+
+    def _get_context(self, ctx):
+        """
+        Generate a context dict suitable to be used as param for MDS API
+        :ctx the context type (schema registry, kafka etc) as defined in MDSAdmin.CTX_*
+        """
+        context = {
+            "clusters": {
+                "kafka-cluster": self.kafka_cluster_id,
+            },
+        }
+        if ctx == MDSAdmin.CTX_KAFKA:
+            return context
+        if ctx == MDSAdmin.CTX_SR:
+            context["clusters"][
+                "schema-registry-cluster"
+            ] = self.schema_registry_cluster_id
+            return context
+        if ctx == MDSAdmin.CTX_KSQL:
+            context["clusters"]["ksql-cluster"] = self.ksql_cluster_id
+            return context
+        if ctx == MDSAdmin.CTX_CONNECT:
+            context["clusters"]["connect-cluster"] = self.connectl_cluster_id
+            return context
+
+    def get_rolebinding_for_user(self, username):
+        data = self._get_context(MDSAdmin.CTX_KAFKA)
+        r = self.transport.post(
+            f"/security/1.0/lookup/principals/{username}/roleNames", json=data
+        )
+        result = r.json()
+        print(f"rolebinding list: {result}")
+        return r.json()
+
+    def reconcile_roles(self, clients: List[Client], dry_run=False):
+        """
+        Iterate over Client list and reconcile current with desired
+        configuration. The missing rolebindings of all clients are planned
+        first and then sent grouped by principal, role and context.
+        :clients a list of Client objects
+        :dry_run Don't change anything but display what would change (and
+        validate if possible)
+        """
+        if not clients:
+            return
+        self.queue_roles(clients)
+        self.apply_rolebindings(dry_run=dry_run)
@@ -60,3 +60,117 @@ class Config(object):
         if "kafkalo" in self.config:
             return self.config["kafkalo"].get("input_dirs", None)
         return None
+
+    def _get_kafkalo_setting(self, key, default=None):
+        """
+        Return a setting from the kafkalo section or default if not set
+        """
+        settings = self.config.get("kafkalo", None) or {}
+        return settings.get(key, default)
+
+    def get_batch_size(self):
+        """
+        Max number of resources to send in a single Kafka admin request
+        """
+        return int(self._get_kafkalo_setting("batch_size", 500))
+
+    def get_incremental_alter_configs(self):
+        """
+        Use incremental_alter_configs to only send changed topic configs
+        """
+        return bool(self._get_kafkalo_setting("incremental_alter_configs", False))
+
+    def get_delete_unmanaged_configs(self):
+        """
+        Delete dynamic topic configs not declared in YAML (incremental mode)
+        """
+        return bool(self._get_kafkalo_setting("delete_unmanaged_configs", False))
+
+    def get_balanced_placement(self):
+        """
+        Compute explicit replica assignments for new topics and partitions
+        """
+        return bool(self._get_kafkalo_setting("balanced_placement", False))
+
+    def get_reassignment_wave_size(self):
+        """
+        Max number of partitions reassigned at the same time
+        """
+        return int(self._get_kafkalo_setting("reassignment_wave_size", 10))
+
+    def get_reassignment_throttle(self):
+        """
+        Replication throttle in bytes/sec used for reassignments
+        """
+        return self._get_kafkalo_setting("reassignment_throttle", None)
+
+    def get_state_file(self):
+        """
+        File recording the fingerprints of applied resources. None disables
+        incremental sync
+        """
+        return self._get_kafkalo_setting("state_file", None)
+
+    def get_state_ttl(self):
+        """
+        Seconds after which unchanged resources are verified again
+        """
+        ttl = self._get_kafkalo_setting("state_ttl", None)
+        if ttl is None:
+            return None
+        return int(ttl)
+
+    def get_parse_workers(self):
+        """
+        Number of processes parsing the input YAML files
+        """
+        return int(self._get_kafkalo_setting("parse_workers", 1))
+
+    def get_parse_cache_dir(self):
+        """
+        Directory caching parsed input files between runs. None disables it
+        """
+        return self._get_kafkalo_setting("parse_cache_dir", None)
+
+    def get_stream_chunk_size(self):
+        """
+        Read and reconcile the input in chunks of this many resources. None
+        loads the whole input at once
+        """
+        size = self._get_kafkalo_setting("stream_chunk_size", None)
+        if size is None:
+            return None
+        return int(size)
+
+    def get_schema_registry_workers(self):
+        """
+        Max number of concurrent Schema Registry requests
+        """
+        return int(self._get_kafkalo_setting("schema_registry_workers", 1))
+
+    def get_schema_cache_file(self):
+        """
+        File to persist the registered schema fingerprints in. None keeps the
+        cache in memory
+        """
+        return self._get_kafkalo_setting("schema_cache", None)
+
+    def get_schema_snapshot(self):
+        """
+        Load the latest schema of all managed subjects in bulk before
+        reconciling schemas
+        """
+        return bool(self._get_kafkalo_setting("schema_snapshot", False))
+
+    def get_schema_compat_check(self):
+        """
+        Check Avro schemas for compatibility with their prior versions
+        locally before registering them
+        """
+        return bool(self._get_kafkalo_setting("schema_compat_check", False))
+
+    def get_schema_snapshot_prefixes(self):
+        """
+        Subject prefixes to load in the schema snapshot. None means all
+        """
+        return self._get_kafkalo_setting("schema_snapshot_prefixes", None)
@@ -1,14 +1,21 @@
-from yaml import load
 from typing import List
+import json
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 try:
     from yaml import CLoader as Loader
 except ImportError:
     from yaml import Loader
 
+from confluent_kafka.schema_registry import SchemaReference
 from kafkalo.topics import Topic
-from kafkalo.schemas import Schema
+from kafkalo.schemas import Schema, canonical_fingerprint
 from kafkalo.clients import Client
+from kafkalo.utils import chunks
+from kafkalo.parse_cache import ParseCache
 from pathlib import Path
 
 
@@ -21,15 +28,214 @@ class DuplicateResourceException(Exception):
     pass
 
 
+class _LineLoader(Loader):
+    """
+    YAML Loader that records the line each mapping starts at, by id of the
+    constructed dict
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.mapping_lines = {}
+
+    def construct_tracked_mapping(self, node):
+        data = {}
+        self.mapping_lines[id(data)] = node.start_mark.line + 1
+        yield data
+        data.update(self.construct_mapping(node))
+
+
+_LineLoader.add_constructor(
+    "tag:yaml.org,2002:map", _LineLoader.construct_tracked_mapping
+)
+
+
+def parse_file(filename, cache_dir=None):
+    """
+    Parse a YAML input file. Runs in worker processes so it only returns
+    picklable data: a tuple (data, lines, error) where lines is
+    {key: [line of each resource under key]}. data and lines are None and
+    error is set if the file can't be parsed
+    :cache_dir optional ParseCache directory. Files parsed before with the
+    same content are loaded from it
+    """
+    with open(filename, "rb") as fp:
+        content = fp.read()
+    cache = key = None
+    if cache_dir:
+        cache = ParseCache(cache_dir)
+        key = cache.key("yaml", content)
+        cached = cache.get(key)
+        if isinstance(cached, list) and len(cached) == 2:
+            return (cached[0], cached[1], None)
+    try:
+        loader = _LineLoader(content.decode("utf-8"))
+        try:
+            data = loader.get_single_data()
+        finally:
+            loader.dispose()
+    except Exception as e:
+        return (None, None, str(e))
+    lines = {}
+    if isinstance(data, dict):
+        for key_name, values in data.items():
+            lines[key_name] = [loader.mapping_lines.get(id(x)) for x in values or []]
+    if cache:
+        cache.put(key, [data, lines])
+    return (data, lines, None)
+
+
+def _serialized(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+# Resources of these kinds are identified by a single field. Other kinds are
+# identified by their whole definition
+RESOURCE_IDENTITY = {
+    "topics": lambda x: x["name"],
+    "clients": lambda x: x["principal"],
+}
+
+
+def _git(args: List[str], cwd=None):
+    """
+    Run a git command and return its output lines
+    """
+    result = subprocess.run(
+        ["git"] + args,
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    return [x for x in result.stdout.splitlines() if x]
+
+
+def git_changed_files(ref: str, cwd=None):
+    """
+    Return the set of absolute paths of files changed since the git ref.
+    Includes uncommitted and untracked files of the working tree.
+    """
+    toplevel = Path(_git(["rev-parse", "--show-toplevel"], cwd=cwd)[0])
+    changed = _git(["diff", "--name-only", ref], cwd=cwd)
+    changed += _git(
+        ["ls-files", "--others", "--exclude-standard", "--full-name"], cwd=cwd
+    )
+    return {Path(toplevel, x).resolve() for x in changed}
+
+
 class InputParser(object):
     """
     Parse the input YAML and feed it to the Admin
     """
 
-    def __init__(self, patterns: List[str]):
+    def __init__(
+        self,
+        patterns: List[str],
+        since=None,
+        streaming=False,
+        workers=1,
+        cache_dir=None,
+    ):
+        """
+        :patterns list of glob patterns of input YAML files
+        :since optional git ref. If set, only resources declared in YAML files
+        changed since that ref (or referencing a changed schema file) are
+        returned. All files are still checked for duplicates.
+        :streaming don't load the input files upfront. Resources are read
+        file by file with iter_resources or iter_chunks instead of the get_*
+        methods
+        :workers number of processes parsing input files. Not used in
+        streaming mode, which parses one file at a time
+        :cache_dir optional directory caching parsed input and schema files
+        by content, so unchanged files are not parsed again on the next run
+        """
         self.patterns = patterns
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.cache = ParseCache(cache_dir) if cache_dir else None
         self.filenames = self._resolve_patterns(patterns)
-        self.data = self._load_and_merge(self.filenames)
+        # Directories schema files are looked up in. Built on first use
+        self.base_dirs = None
+        # {schema path as referenced in YAML: absolute path}
+        self.path_index = {}
+        # {(absolute path, mtime): (schema text, fingerprint)}
+        self.schema_files = {}
+        self.changed_files = None
+        if since:
+            self.changed_files = git_changed_files(since)
+        # The files whose resources are returned by the get_* methods
+        self.selected_filenames = []
+        # {kind: {identity: (filename, line)}} of all the files, selected or
+        # not. Multiple definitions of the same resource would overwrite one
+        # another unpredictably
+        self.index = {}
+        # Subjects already returned by iter_resources
+        self.streamed_subjects = set()
+        self.data = {}
+        if not streaming:
+            self.data = self._load_and_merge(self.filenames)
+
+    def _load_file(self, filename):
+        """
+        Load a single YAML file. Returns a tuple (data, lines) where lines is
+        {key: [line of each resource under key]}. Returns (None, None) if
+        the file can't be parsed
+        """
+        return self._check_parsed(filename, parse_file(filename, self.cache_dir))
+
+    def _check_parsed(self, filename, result):
+        """
+        Report parse errors of a parse_file result and return (data, lines)
+        """
+        data, lines, error = result
+        if error:
+            print(f"Failed to open file {filename} with error: {error}")
+        return (data, lines)
+
+    def _parse_files(self, filenames: List[str]):
+        """
+        Yield (filename, data, lines) of files in order. Files are parsed in
+        a pool of self.workers processes, unless there is a single worker.
+        """
+        if self.workers <= 1 or len(filenames) <= 1:
+            for filename in filenames:
+                yield (filename, *self._load_file(filename))
+            return
+        chunksize = max(1, len(filenames) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(
+                partial(parse_file, cache_dir=self.cache_dir),
+                filenames,
+                chunksize=chunksize,
+            )
+            for filename, result in zip(filenames, results):
+                yield (filename, *self._check_parsed(filename, result))
+
+    def _is_selected(self, filename, data: dict):
+        """
+        True if the resources of this file should be reconciled.
+        Without a `since` ref all files are selected. Otherwise the file must
+        have changed or reference a changed schema file
+        """
+        if self.changed_files is None:
+            return True
+        if Path(filename).resolve() in self.changed_files:
+            return True
+        specs = []
+        for topicdata in data.get("topics", None) or []:
+            specs += [topicdata[x] for x in ("key", "value") if x in topicdata]
+        while specs:
+            spec = specs.pop()
+            # Referenced schema files are part of the topic's schemas
+            specs += [x for x in spec.get("references", None) or [] if "schema" in x]
+            try:
+                schema_path = self._resolve_schema_path(spec["schema"])
+            except Exception:
+                continue
+            if schema_path.resolve() in self.changed_files:
+                return True
+        return False
 
     def _load_and_merge(self, filenames: List[str]):
         """
@@ -39,28 +245,101 @@ class InputParser(object):
             print("No input files available!")
             return {}
         merged_data = {}
-        for filename in filenames:
-            with open(filename, "r") as fp:
-                try:
-                    data = load(fp.read(), Loader=Loader)
-                except Exception as e:
-                    print(f"Failed to open file {filename} with error: {e}")
-                    continue
-                # Now merge the keys
-                for key, values in data.items():
-                    if key not in merged_data:
-                        merged_data[key] = []
-                    # Test if a value already exists in merged data. This would
-                    # indicate multiple definitions for the same resource and
-                    # would overwite one unpredictable
-                    for value in values:
-                        if value in merged_data[key]:
-                            raise DuplicateResourceException(
-                                f"Resource {value} already declared elsewhere"
-                            )
-                    merged_data[key] += values
+        for data in self._iter_selected_files(filenames):
+            # Now merge the keys
+            for key, values in data.items():
+                if key not in merged_data:
+                    merged_data[key] = []
+                merged_data[key] += values
         return merged_data
 
+    def _iter_selected_files(self, filenames: List[str], streaming=False):
+        """
+        Load files, check their resources are not declared elsewhere and
+        yield the data of the selected ones in input order
+        :streaming parse one file at a time instead of using the worker pool,
+        which would hold all parsed files in memory
+        """
+        if streaming:
+            parsed = ((x, *self._load_file(x)) for x in filenames)
+        else:
+            parsed = self._parse_files(filenames)
+        for filename, data, lines in parsed:
+            if not data:
+                continue
+            self._index_resources(self.index, filename, data, lines)
+            if not self._is_selected(filename, data):
+                continue
+            self.selected_filenames.append(filename)
+            yield data
+
+    def _check_identity(self, kind_index: dict, kind, identity, filename, line):
+        """
+        Add a resource to the index of its kind, raising
+        DuplicateResourceException if it's already declared
+        """
+        if identity in kind_index:
+            other_filename, other_line = kind_index[identity]
+            raise DuplicateResourceException(
+                f"Resource {identity} of {kind} at {filename}:{line} already "
+                f"declared at {other_filename}:{other_line}"
+            )
+        kind_index[identity] = (filename, line)
+
+    def _index_resources(self, index: dict, filename, data: dict, lines: dict):
+        """
+        Index the resources of a file by identity (topic name, principal,
+        subject) and check they are not declared elsewhere
+        """
+        for key, values in data.items():
+            kind_index = index.setdefault(key, {})
+            identity_func = RESOURCE_IDENTITY.get(key, _serialized)
+            for value, line in zip(values or [], lines[key]):
+                self._check_identity(
+                    kind_index, key, identity_func(value), filename, line
+                )
+                if key == "topics":
+                    self._index_subjects(index, value, filename, line)
+
+    def _index_subjects(self, index: dict, topicdata: dict, filename, line):
+        """
+        Index the subjects declared by a topic, including referenced subjects
+        with a schema file. A referenced subject may be declared more than
+        once, as long as it's declared with the same schema
+        """
+        subjects = index.setdefault("subjects", {})
+        specs = [
+            (f"{topicdata['name']}-{x}", topicdata[x])
+            for x in ("key", "value")
+            if x in topicdata
+        ]
+        while specs:
+            subject, spec = specs.pop()
+            specs += [
+                (x["subject"], x)
+                for x in spec.get("references", None) or []
+                if "schema" in x
+            ]
+            references = tuple(
+                (x["name"], x["subject"], x.get("version", None))
+                for x in spec.get("references", None) or []
+            )
+            identity = (
+                subject,
+                spec["schema"],
+                spec.get("schema_type", None),
+                references,
+            )
+            if subject in subjects and subjects[subject][0] == identity:
+                continue
+            if subject in subjects:
+                other_filename, other_line = subjects[subject][1]
+                raise DuplicateResourceException(
+                    f"Subject {subject} at {filename}:{line} already declared "
+                    f"with a different schema at {other_filename}:{other_line}"
+                )
+            subjects[subject] = (identity, (filename, line))
+
     def _resolve_patterns(self, patterns: List[str]):
         """
         Iterate of the list of glob patterns and return a list of files to load
@@ -74,7 +353,11 @@ class InputParser(object):
             if "*" not in p.name:
                 filenames.append(pattern)
             else:
-                filenames += [x for x in p.parent.glob(p.name) if not Path(x).is_dir()]
+                # Sorted so that the input order doesn't depend on the
+                # filesystem
+                filenames += sorted(
+                    x for x in p.parent.glob(p.name) if not Path(x).is_dir()
+                )
         return filenames
 
     def _make_schema_dict(self, topic_data):
@@ -84,31 +367,25 @@ class InputParser(object):
         """
         schema = {}
 
-        if "key" in topic_data:
-            schema["key"] = {
-                "fromFile": topic_data["key"]["schema"],
-                "compatibility": topic_data["key"].get("compatibility", None),
-            }
-        if "value" in topic_data:
-            schema["value"] = {
-                "fromFile": topic_data["value"]["schema"],
-                "compatibility": topic_data["value"].get("compatibility", None),
-            }
+        for part in ("key", "value"):
+            if part in topic_data:
+                schema[part] = {
+                    "fromFile": topic_data[part]["schema"],
+                    "compatibility": topic_data[part].get("compatibility", None),
+                    "schema_type": topic_data[part].get("schema_type", None),
+                    "references": topic_data[part].get("references", None),
+                }
         if schema.keys():
             return schema
         else:
             return None
 
-    def get_topics(self):
+    def _make_topics(self, data: dict):
         """
-        Return a list o Topic objects found in the input YAML.
+        Return the Topic objects of the data of one or more files
         """
-        # TODO make this a generator as they number of topics could be big.
-        resp = []
-        if "topics" not in self.data:
-            print("topics key not found in input")
-            return resp
-        for topicdata in self.data["topics"]:
+        topics = []
+        for topicdata in data.get("topics", None) or []:
             schema_data = self._make_schema_dict(topicdata)
             topic = Topic(
                 name=topicdata["name"],
@@ -117,20 +394,26 @@ class InputParser(object):
                 configs=topicdata.get("configs", None),
                 schema=schema_data,
             )
-            resp.append(topic)
-        return resp
+            topics.append(topic)
+        return topics
 
-    def _load_avsc(self, filepath):
+    def get_topics(self):
         """
-        Load an avsc file relative to the YAML it is referenced in.
-        If an absolute path is provided, load it. Otherwise search relative to input_dirs paths.
+        Return a list o Topic objects found in the input YAML.
+        Use iter_resources to stream large inputs.
         """
-        # Identify the parent folder to use
-        filepath = Path(filepath)
-        if filepath.is_absolute() and filepath.exists():
-            with open(filepath, "r") as fp:
-                return fp.read()
-        # Not absolute path. Figure out all possible parents for relative path
+        if "topics" not in self.data:
+            print("topics key not found in input")
+            return []
+        return self._make_topics(self.data)
+
+    def _get_base_dirs(self):
+        """
+        Return the directories relative schema paths are looked up in: the
+        directories of the input patterns
+        """
+        if self.base_dirs is not None:
+            return self.base_dirs
         base_dirs = []
         for pattern in self.patterns:
             path = Path(pattern).absolute()
@@ -141,8 +424,27 @@ class InputParser(object):
             else:
                 # Uhm, what now?
                 pass
+        self.base_dirs = base_dirs
+        return base_dirs
+
+    def _resolve_schema_path(self, filepath):
+        """
+        Find a schema file referenced in a YAML.
+        If an absolute path is provided, use it. Otherwise search relative to input_dirs paths.
+        Resolved paths are indexed so each path is only searched once.
+        """
+        key = str(filepath)
+        if key not in self.path_index:
+            self.path_index[key] = self._find_schema_path(filepath)
+        return self.path_index[key]
+
+    def _find_schema_path(self, filepath):
+        # Identify the parent folder to use
+        filepath = Path(filepath)
+        if filepath.is_absolute() and filepath.exists():
+            return filepath
         found = None
-        for base_dir in base_dirs:
+        for base_dir in self._get_base_dirs():
             candidate = Path(base_dir, filepath)
             if candidate.is_absolute() and candidate.exists():
                 if not found:
@@ -153,37 +455,113 @@ class InputParser(object):
                     )
         if not found:
             raise Exception(f"Schema {filepath} not found")
-        with open(found) as fp:
-            return fp.read()
+        return found
 
-    def get_schemas(self):
-        topics = self.get_topics()
-        schemas = []
+    def _load_schema_file(self, filepath):
+        """
+        Load a schema file relative to the YAML it is referenced in.
+        Returns a tuple (schema text, fingerprint). Files are cached by path
+        and modification time so each file is read and hashed once.
+        """
+        path = self._resolve_schema_path(filepath)
+        key = (path, os.stat(path).st_mtime_ns)
+        if key not in self.schema_files:
+            self.schema_files[key] = self._read_schema_file(path)
+        return self.schema_files[key]
+
+    def _read_schema_file(self, path):
+        """
+        Read a schema file and fingerprint it, using the parse cache if set
+        """
+        if not self.cache:
+            with open(path) as fp:
+                schema_data = fp.read()
+            return (schema_data, canonical_fingerprint(schema_data))
+        with open(path, "rb") as fp:
+            content = fp.read()
+        cache_key = self.cache.key("schema", content)
+        cached = self.cache.get(cache_key)
+        if isinstance(cached, list) and len(cached) == 2:
+            return tuple(cached)
+        schema_data = content.decode("utf-8")
+        fingerprint = canonical_fingerprint(schema_data)
+        self.cache.put(cache_key, [schema_data, fingerprint])
+        return (schema_data, fingerprint)
+
+    def _load_avsc(self, filepath):
+        """
+        Load an avsc file relative to the YAML it is referenced in.
+        """
+        return self._load_schema_file(filepath)[0]
+
+    def _add_schema(self, schemas: dict, schema: Schema):
+        """
+        Add schema to the {subject: Schema} dict. A subject may be declared
+        more than once (e.g. a shared reference) as long as it's the same
+        schema. The fingerprint includes the references
+        """
+        existing = schemas.get(schema.subject_name, None)
+        if existing is None:
+            schemas[schema.subject_name] = schema
+            return schema
+        if (existing.fingerprint, existing.schema_type) != (
+            schema.fingerprint,
+            schema.schema_type,
+        ):
+            raise DuplicateResourceException(
+                f"Subject {schema.subject_name} already declared elsewhere "
+                f"with a different schema"
+            )
+        return existing
+
+    def _make_schema(self, subject: str, filename, spec: dict, schemas: dict):
+        """
+        Create the Schema of subject from its spec. Referenced subjects with
+        a schema file are added to schemas so they are registered as well
+        """
+        references = []
+        for ref in spec.get("references", None) or []:
+            if ref.get("schema", None):
+                self._make_schema(ref["subject"], ref["schema"], ref, schemas)
+            references.append(
+                SchemaReference(ref["name"], ref["subject"], ref.get("version", None))
+            )
+        schema_data, fingerprint = self._load_schema_file(filename)
+        schema = Schema(
+            subject_name=subject,
+            schema=schema_data,
+            fingerprint=fingerprint,
+            compatibility=spec.get("compatibility", None),
+            schema_type=spec.get("schema_type", None),
+            references=references,
+        )
+        return self._add_schema(schemas, schema)
+
+    def _make_schemas(self, topics: List[Topic]):
+        """
+        Return the schemas of topics and the subjects they reference.
+        Each subject is returned once
+        """
+        schemas = {}
         for topic in topics:
-            if topic.schema:
-                if "key" in topic.schema:
-                    filename = topic.schema["key"].get("fromFile", None)
-                    if filename:
-                        schema_data = self._load_avsc(filename)
-                        compatibility = topic.schema["key"].get("compatibility", None)
-                        schema = Schema(
-                            subject_name=f"{topic.name}-key",
-                            schema=schema_data,
-                            compatibility=compatibility,
-                        )
-                        schemas.append(schema)
-                if "value" in topic.schema:
-                    filename = topic.schema["value"].get("fromFile", None)
-                    if filename:
-                        schema_data = self._load_avsc(filename)
-                        compatibility = topic.schema["value"].get("compatibility", None)
-                        schema = Schema(
-                            subject_name=f"{topic.name}-value",
-                            schema=schema_data,
-                            compatibility=compatibility,
-                        )
-                        schemas.append(schema)
-        return schemas
+            if not topic.schema:
+                continue
+            for part in ("key", "value"):
+                if part not in topic.schema:
+                    continue
+                filename = topic.schema[part].get("fromFile", None)
+                if filename:
+                    self._make_schema(
+                        f"{topic.name}-{part}", filename, topic.schema[part], schemas
+                    )
+        return list(schemas.values())
+
+    def get_schemas(self):
+        """
+        Return the schemas of the topics and the subjects they reference.
+        Each subject is returned once
+        """
+        return self._make_schemas(self.get_topics())
 
     def get_schemas_as_dict(self):
         """
@@ -195,14 +573,12 @@ class InputParser(object):
             schemas[schema.subject_name] = schema
         return schemas
 
-    def get_clients(self):
+    def _make_clients(self, data: dict):
         """
-        Get the the client configuration
+        Return the Client objects of the data of one or more files
         """
-        if "clients" not in self.data:
-            return None
         clients = []
-        for client_dict in self.data["clients"]:
+        for client_dict in data.get("clients", None) or []:
             client = Client(
                 principal=client_dict["principal"],
                 consumer_for=client_dict.get("consumer_for", None),
@@ -212,3 +588,41 @@ class InputParser(object):
             )
             clients.append(client)
         return clients
+
+    def get_clients(self):
+        """
+        Get the the client configuration
+        """
+        if "clients" not in self.data:
+            return None
+        return self._make_clients(self.data)
+
+    def iter_resources(self):
+        """
+        Yield the Topic, Schema and Client objects of the input file by file,
+        so only one file is kept in memory. Shared referenced subjects are
+        yielded once, before the schemas referencing them.
+        Duplicates are detected as files are read, so a duplicate in a later
+        file is only reported after the resources of earlier files were
+        yielded.
+        """
+        for data in self._iter_selected_files(self.filenames, streaming=True):
+            topics = self._make_topics(data)
+            yield from topics
+            for schema in self._make_schemas(topics):
+                if schema.subject_name not in self.streamed_subjects:
+                    self.streamed_subjects.add(schema.subject_name)
+                    yield schema
+            yield from self._make_clients(data)
+
+    def iter_chunks(self, size: int):
+        """
+        Yield tuples (topics, schemas, clients) of lists holding together at
+        most size resources, in input order
+        """
+        for chunk in chunks(self.iter_resources(), size):
+            yield (
+                [x for x in chunk if isinstance(x, Topic)],
+                [x for x in chunk if isinstance(x, Schema)],
+                [x for x in chunk if isinstance(x, Client)],
+            )
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import json
+from pathlib import Path
+from kafkalo import __version__
+
+
+class ParseCache(object):
+    """
+    On-disk cache of parsed input files.
+    Entries are keyed by a hash of the file content and the kafkalo version,
+    so a changed file or a kafkalo upgrade is a cache miss. Entries are
+    stored as JSON so a shared cache directory can't inject code. Tuples are
+    read back as lists, and values that don't survive a JSON round trip
+    (e.g. YAML dates or non-string keys) are not cached.
+    """
+
+    def __init__(self, directory):
+        """
+        :directory the cache directory. Created on the first write
+        """
+        self.directory = Path(directory)
+
+    def key(self, kind: str, content: bytes):
+        """
+        Return the cache key of a file of kind (e.g. yaml or schema) with
+        content
+        """
+        digest = hashlib.sha256(f"{__version__}:{kind}:".encode("utf-8"))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str):
+        return Path(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Return the cached value of key or None
+        """
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable parse cache entry {self._path(key)}: {e}")
+            return None
+
+    def put(self, key: str, value):
+        """
+        Store value under key atomically. Values that can't be stored as JSON
+        as they are are skipped
+        """
+        try:
+            text = json.dumps(value)
+        except (TypeError, ValueError):
+            return
+        if json.loads(text) != value:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            fp.write(text)
+        os.replace(tmp_path, path)
@@ -0,0 +1,112 @@
+from typing import List
+
+
+class PlacementError(Exception):
+    """
+    Raised when a valid replica assignment can't be computed
+    """
+
+    pass
+
+
+class ReplicaPlacer(object):
+    """
+    Computes explicit replica assignments for new partitions.
+    Leaders and followers are placed on the least loaded brokers, and
+    followers prefer racks that don't already hold a replica of the same
+    partition.
+    """
+
+    def __init__(self, metadata, racks=None):
+        """
+        :metadata a ClusterMetadata as returned by list_topics. Provides the
+        brokers and the existing load of each broker.
+        :racks optional dict of broker id to rack name
+        """
+        self.brokers = sorted(metadata.brokers.keys())
+        self.racks = racks or {}
+        self.replica_count = {broker: 0 for broker in self.brokers}
+        self.leader_count = {broker: 0 for broker in self.brokers}
+        for topic in metadata.topics.values():
+            for partition in topic.partitions.values():
+                for replica in partition.replicas:
+                    if replica in self.replica_count:
+                        self.replica_count[replica] += 1
+                if partition.leader in self.leader_count:
+                    self.leader_count[partition.leader] += 1
+
+    def _pick_leader(self):
+        return min(
+            self.brokers,
+            key=lambda x: (self.leader_count[x], self.replica_count[x], x),
+        )
+
+    def _pick_follower(self, replicas: List[int]):
+        used_racks = {self.racks.get(x) for x in replicas if x in self.racks}
+        candidates = [x for x in self.brokers if x not in replicas]
+        return min(
+            candidates,
+            key=lambda x: (
+                self.racks.get(x, None) in used_racks,
+                self.replica_count[x],
+                x,
+            ),
+        )
+
+    def _removal_key(self, broker: int, replicas: List[int]):
+        rack = self.racks.get(broker, None)
+        shared_rack = rack is not None and any(
+            self.racks.get(x, None) == rack for x in replicas if x != broker
+        )
+        return (shared_rack, self.replica_count.get(broker, 0), broker)
+
+    def assign(self, partitions: int, replication_factor: int):
+        """
+        Return a list of replica lists (one per partition) for the requested
+        number of partitions. The first replica of each list is the
+        preferred leader. The load of the placer is updated so consecutive
+        calls keep the cluster balanced.
+        """
+        if replication_factor > len(self.brokers):
+            raise PlacementError(
+                f"Replication factor {replication_factor} is larger than the "
+                f"number of brokers ({len(self.brokers)})"
+            )
+        assignment = []
+        for _ in range(partitions):
+            replicas = [self._pick_leader()]
+            while len(replicas) < replication_factor:
+                replicas.append(self._pick_follower(replicas))
+            self.leader_count[replicas[0]] += 1
+            for replica in replicas:
+                self.replica_count[replica] += 1
+            assignment.append(replicas)
+        return assignment
+
+    def change_replication_factor(self, replicas: List[int], replication_factor: int):
+        """
+        Return a new replica list for an existing partition with the
+        requested replication factor, moving as few replicas as possible.
+        The preferred leader and the other existing replicas are kept. New
+        followers go to the least loaded brokers and followers are removed
+        from the most loaded brokers (preferring racks holding more than one
+        replica of the partition). The load of the placer is updated.
+        """
+        if replication_factor > len(self.brokers):
+            raise PlacementError(
+                f"Replication factor {replication_factor} is larger than the "
+                f"number of brokers ({len(self.brokers)})"
+            )
+        if replication_factor < 1:
+            raise PlacementError("Replication factor must be at least 1")
+        replicas = list(replicas)
+        while len(replicas) < replication_factor:
+            follower = self._pick_follower(replicas)
+            self.replica_count[follower] += 1
+            replicas.append(follower)
+        while len(replicas) > replication_factor:
+            follower = max(replicas[1:], key=lambda x: self._removal_key(x, replicas))
+            if follower in self.replica_count:
+                self.replica_count[follower] -= 1
+            replicas.remove(follower)
+        return replicas
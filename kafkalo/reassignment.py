@@ -0,0 +1,187 @@
+import json
+from pathlib import Path
+from typing import List
+from kafkalo.placement import ReplicaPlacer, PlacementError
+from kafkalo.utils import chunks
+
+
+def load_partition_sizes(filename):
+    """
+    Load partition sizes from the output of `kafka-log-dirs.sh --describe`.
+    The tool prints status lines before the JSON, so the raw output is
+    accepted as well as the JSON alone.
+    Returns a dict of (topic, partition) to the size in bytes of the largest
+    replica.
+    """
+    with open(filename, "r") as fp:
+        content = fp.read()
+    try:
+        data = json.loads(content)
+    except ValueError:
+        # Raw tool output: the JSON is the line starting with {
+        lines = [x.strip() for x in content.splitlines() if x.strip()]
+        json_lines = [x for x in lines if x.startswith("{")] or lines[-1:]
+        data = json.loads(json_lines[0] if json_lines else content)
+    sizes = {}
+    for broker in data.get("brokers", []):
+        for log_dir in broker.get("logDirs", []):
+            for partition in log_dir.get("partitions", []):
+                topic, _, partition_id = partition["partition"].rpartition("-")
+                key = (topic, int(partition_id))
+                sizes[key] = max(sizes.get(key, 0), partition["size"])
+    return sizes
+
+
+class ReassignmentPlanner(object):
+    """
+    Plan the replica reassignments needed to change the replication factor
+    of existing topics.
+    Reassignments are split in waves of at most wave_size partitions, so that
+    only a bounded number of partitions replicate at the same time. Kafka's
+    AdminClient can't submit reassignments, so each wave is written as a
+    kafka-reassign-partitions.sh JSON file to be run with --throttle.
+    """
+
+    def __init__(
+        self,
+        metadata,
+        racks=None,
+        wave_size=10,
+        throttle=None,
+        partition_sizes=None,
+    ):
+        """
+        :metadata a ClusterMetadata as returned by list_topics
+        :racks optional dict of broker id to rack name
+        :wave_size max number of partitions reassigned concurrently
+        :throttle replication throttle in bytes/sec for each wave
+        :partition_sizes optional dict of (topic, partition) to size in bytes
+        as returned by load_partition_sizes
+        """
+        self.metadata = metadata
+        self.placer = ReplicaPlacer(metadata, racks=racks)
+        self.wave_size = wave_size
+        self.throttle = throttle
+        self.partition_sizes = partition_sizes or {}
+        # List of {"topic": str, "partition": int, "replicas": [int],
+        # "before": [int], "bytes": int}
+        self.moves = []
+
+    def _partition_size(self, topic: str, partition: int):
+        return self.partition_sizes.get((topic, partition), None)
+
+    def _sum_bytes(self, sizes):
+        """
+        Sum sizes, returning None if any size is unknown
+        """
+        if any(x is None for x in sizes):
+            return None
+        return sum(sizes)
+
+    def under_replication(self, topic: str):
+        """
+        Return the under-replicated partitions of a topic: partitions with
+        replicas not in the ISR. This may be a running reassignment catching
+        up as well as a broker being down, the metadata can't tell them apart.
+        """
+        lagging_sizes = []
+        for partition_id, partition in self.metadata.topics[topic].partitions.items():
+            lagging = [x for x in partition.replicas if x not in partition.isrs]
+            if lagging:
+                size = self._partition_size(topic, partition_id)
+                lagging_sizes.append(None if size is None else size * len(lagging))
+        return {
+            "partitions_under_replicated": len(lagging_sizes),
+            "lagging_bytes": self._sum_bytes(lagging_sizes),
+        }
+
+    def plan_topic(self, topic: str, replication_factor: int):
+        """
+        Plan the moves to change the replication factor of an existing topic.
+        Returns a dict describing the change, suitable for a dry run plan.
+        """
+        partitions = self.metadata.topics[topic].partitions
+        current = len(next(iter(partitions.values())).replicas) if partitions else 0
+        moves = []
+        error = None
+        for partition_id in sorted(partitions.keys()):
+            before = partitions[partition_id].replicas
+            try:
+                after = self.placer.change_replication_factor(
+                    before, replication_factor
+                )
+            except PlacementError as e:
+                error = str(e)
+                moves = []
+                break
+            if after == list(before):
+                continue
+            added = len([x for x in after if x not in before])
+            size = self._partition_size(topic, partition_id)
+            moves.append(
+                {
+                    "topic": topic,
+                    "partition": partition_id,
+                    "before": list(before),
+                    "replicas": after,
+                    "bytes": None if size is None else size * added,
+                }
+            )
+        self.moves += moves
+        return {
+            "before": current,
+            "after": replication_factor,
+            "partitions": len(moves),
+            "bytes": self._sum_bytes([x["bytes"] for x in moves]),
+            "failed": error,
+        }
+
+    def get_waves(self):
+        """
+        Return the planned moves as a list of waves. Each wave is a
+        kafka-reassign-partitions.sh reassignment document.
+        """
+        waves = []
+        for chunk in chunks(self.moves, self.wave_size):
+            waves.append(
+                {
+                    "version": 1,
+                    "partitions": [
+                        {
+                            "topic": x["topic"],
+                            "partition": x["partition"],
+                            "replicas": x["replicas"],
+                        }
+                        for x in chunk
+                    ],
+                }
+            )
+        return waves
+
+    def get_summary(self):
+        """
+        Return a summary of the planned waves for reports
+        """
+        return {
+            "waves": len(self.get_waves()),
+            "partitions": len(self.moves),
+            "bytes": self._sum_bytes([x["bytes"] for x in self.moves]),
+            "throttle": self.throttle,
+        }
+
+    def write_waves(self, directory) -> List[Path]:
+        """
+        Write each wave as a JSON file in directory and return the file paths.
+        Waves must be executed in order, waiting for each to complete with
+        kafka-reassign-partitions.sh --verify (which also removes the
+        throttle) before starting the next one.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        filenames = []
+        for index, wave in enumerate(self.get_waves(), start=1):
+            filename = Path(directory, f"reassignment-wave-{index:03d}.json")
+            with open(filename, "w") as fp:
+                json.dump(wave, fp, indent=2)
+            filenames.append(filename)
+        return filenames
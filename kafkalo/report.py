@@ -19,12 +19,14 @@ class Report(object):
         topics_context=None,
         client_context=None,
         schema_context=None,
+        reassignment_context=None,
     ):
         self.template = template
         self.context = {}
         self.context["clients"] = client_context
         self.context["topics"] = topics_context
         self.context["schemas"] = schema_context
+        self.context["reassignment"] = reassignment_context
 
     def render(self):
         template = env.get_template(self.template)
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class SchemaFingerprintCache(object):
+    """
+    Local cache of the schemas registered in the Schema Registry.
+    Maps subject -> {canonical fingerprint: version} and is persisted
+    between runs so that schemas already registered don't need a lookup.
+
+    The text of the cached schemas is kept as well ({fingerprint: schema})
+    so that prior versions can be checked for compatibility locally.
+
+    The cache is bound to a registry url. Subjects that no longer exist in
+    the registry are invalidated when the subject list is loaded, and a
+    version we have seen is never trusted for a subject whose latest version
+    is older than it (the subject was deleted and re-created). Entries with
+    an unknown version are never trusted.
+    """
+
+    def __init__(self, filename=None, registry_url=None):
+        """
+        :filename file to persist the cache in. None keeps it in memory only
+        :registry_url the url of the registry the cache belongs to
+        """
+        self.filename = Path(filename) if filename else None
+        self.registry_url = registry_url
+        self.lock = threading.Lock()
+        self.subjects = {}
+        self.schemas = {}
+        self._load()
+
+    def _load(self):
+        if not self.filename or not self.filename.exists():
+            return
+        try:
+            with open(self.filename, "r") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable schema cache {self.filename}: {e}")
+            return
+        if data.get("registry_url", None) != self.registry_url:
+            return
+        self.subjects = data.get("subjects", {})
+        self.schemas = data.get("schemas", {})
+
+    def contains(self, subject: str, fingerprint: str):
+        """
+        True if a schema with this fingerprint is registered under subject
+        """
+        return fingerprint in self.subjects.get(subject, {})
+
+    def get_version(self, subject: str, fingerprint: str):
+        """
+        Return the version the schema with fingerprint is cached at under
+        subject, or None if not cached or the version is unknown
+        """
+        return self.subjects.get(subject, {}).get(fingerprint, None)
+
+    def add(self, subject: str, fingerprint: str, version=None):
+        """
+        Record that the schema with fingerprint is registered under subject.
+        version may be None if unknown
+        """
+        with self.lock:
+            self.subjects.setdefault(subject, {})[fingerprint] = version
+
+    def add_schema(self, subject: str, fingerprint: str, version: int, schema: str):
+        """
+        Record a registered version of subject along with its schema text
+        """
+        with self.lock:
+            self.subjects.setdefault(subject, {})[fingerprint] = version
+            self.schemas[fingerprint] = schema
+
+    def get_versions(self, subject: str):
+        """
+        Return {version: schema text} of the cached versions of subject
+        whose text is known
+        """
+        with self.lock:
+            return {
+                version: self.schemas[fingerprint]
+                for fingerprint, version in self.subjects.get(subject, {}).items()
+                if version is not None and fingerprint in self.schemas
+            }
+
+    def invalidate(self, subjects):
+        """
+        Drop cached subjects that are not in the registry's subject list
+        """
+        existing = set(subjects)
+        with self.lock:
+            for subject in list(self.subjects.keys()):
+                if subject not in existing:
+                    del self.subjects[subject]
+
+    def invalidate_versions(self, subject: str, latest_version: int):
+        """
+        Drop cached versions of subject newer than its latest version
+        """
+        with self.lock:
+            versions = self.subjects.get(subject, {})
+            for fingerprint, version in list(versions.items()):
+                if version is not None and version > latest_version:
+                    del versions[fingerprint]
+
+    def save(self):
+        """
+        Persist the cache atomically. Does nothing for in-memory caches
+        """
+        if not self.filename:
+            return
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp_filename = self.filename.with_name(self.filename.name + ".tmp")
+        with self.lock:
+            # Drop texts of schemas no longer cached under any subject
+            used = {x for versions in self.subjects.values() for x in versions}
+            schemas = {k: v for k, v in self.schemas.items() if k in used}
+            with open(tmp_filename, "w") as fp:
+                json.dump(
+                    {
+                        "registry_url": self.registry_url,
+                        "subjects": self.subjects,
+                        "schemas": schemas,
+                    },
+                    fp,
+                    sort_keys=True,
+                )
+        os.replace(tmp_filename, self.filename)
@@ -1,6 +1,75 @@
 from typing import List
-from confluent_kafka.schema_registry import Schema as CPSchema
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+from confluent_kafka.schema_registry import Schema as CPSchema, SchemaReference
 from confluent_kafka.schema_registry.error import SchemaRegistryError
+from kafkalo.schema_cache import SchemaFingerprintCache
+from kafkalo.avro_compat import check_compatibility, AvroSchemaError
+
+
+def _compat_level(result):
+    """
+    get_compatibility returns a dict in older clients and the level in newer
+    """
+    if isinstance(result, dict):
+        result = result["compatibilityLevel"]
+    return result.lower()
+
+
+SCHEMA_TYPES = ("AVRO", "JSON", "PROTOBUF")
+
+
+class SchemaDependencyError(Exception):
+    """
+    Raised when schema references can't be ordered (circular references)
+    """
+
+    pass
+
+
+# Latest registered schema of a subject, as loaded by SchemaAdmin.load_snapshot
+SubjectSnapshot = namedtuple("SubjectSnapshot", ["version", "schema_id", "fingerprint"])
+
+
+def canonical_fingerprint(schema_str: str):
+    """
+    Return a fingerprint of the canonical form of a schema.
+    JSON schemas (Avro) are serialized with sorted attributes and no
+    whitespace, so formatting and attribute order don't change the
+    fingerprint. Anything else is fingerprinted with whitespace collapsed.
+    """
+    try:
+        canonical = json.dumps(
+            json.loads(schema_str), sort_keys=True, separators=(",", ":")
+        )
+    except ValueError:
+        canonical = " ".join(schema_str.split())
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def reference_fingerprint(fingerprint: str, references):
+    """
+    Combine the fingerprint of a schema text with its references, a list of
+    (name, subject, version) tuples. The same text referencing different
+    subjects or versions is a different schema. Schemas without references
+    keep the fingerprint of their text.
+    """
+    if not references:
+        return fingerprint
+    data = json.dumps([fingerprint, [list(x) for x in references]])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def registered_fingerprint(schema: CPSchema):
+    """
+    Return the fingerprint of a schema returned by the registry
+    """
+    return reference_fingerprint(
+        canonical_fingerprint(schema.schema_str),
+        [(x.name, x.subject, x.version) for x in schema.references or []],
+    )
 
 
 class Schema(object):
@@ -8,37 +77,143 @@ class Schema(object):
     Represents a single Schema.
     """
 
-    def __init__(self, subject_name: str, schema: str, compatibility=None):
+    def __init__(
+        self,
+        subject_name: str,
+        schema: str,
+        compatibility=None,
+        schema_type="AVRO",
+        references=None,
+        fingerprint=None,
+    ):
         """
         A Schema object
         :subject_name the schema subject
         :schema the schema representation
         :compatibility the compatibility level. Set to python None object will
         use the Schema registry default
+        :schema_type one of AVRO, JSON or PROTOBUF
+        :references list of SchemaReference to other subjects. A reference
+        with a version of None is resolved before registering. The declared
+        references are never changed, resolved versions are kept in
+        resolved_versions
+        :fingerprint the canonical fingerprint of the schema text, if already
+        known
         """
 
         self.subject_name = subject_name
         self.schema_json = schema
-        # TODO AVRO hardcoded. Fix this by adding a field to yaml and default
-        # to AVRO
-        self.schema = CPSchema(self.schema_json, "AVRO")
+        self.schema_type = (schema_type or "AVRO").upper()
+        if self.schema_type not in SCHEMA_TYPES:
+            raise ValueError(
+                f"Unknown schema type {schema_type} for {subject_name}. "
+                f"Must be one of {', '.join(SCHEMA_TYPES)}"
+            )
+        self.references = references or []
+        # {reference name: version} of references declared without a version
+        self.resolved_versions = {}
+        self.text_fingerprint = fingerprint or canonical_fingerprint(self.schema_json)
         if compatibility:
             self.compatibility = compatibility.strip().lower()
         else:
             self.compatibility = None
 
+    @property
+    def schema(self):
+        """
+        The schema as a confluent_kafka Schema
+        """
+        return CPSchema(self.schema_json, self.schema_type, self.resolved_references)
+
+    @property
+    def resolved_references(self):
+        """
+        Copies of the references with the resolved versions set
+        """
+        return [
+            SchemaReference(
+                x.name,
+                x.subject,
+                (
+                    x.version
+                    if x.version is not None
+                    else self.resolved_versions.get(x.name)
+                ),
+            )
+            for x in self.references
+        ]
+
+    @property
+    def fingerprint(self):
+        """
+        Fingerprint of the schema text and its (resolved) references
+        """
+        return reference_fingerprint(
+            self.text_fingerprint,
+            [(x.name, x.subject, x.version) for x in self.resolved_references],
+        )
+
+    def has_unresolved_references(self):
+        return any(x.version is None for x in self.resolved_references)
+
+
+def dependency_levels(schemas: List[Schema]):
+    """
+    Group schemas in levels so that schemas only reference subjects of
+    previous levels (or subjects not in schemas). Schemas of the same level
+    don't depend on each other and can be registered concurrently.
+    Returns a list of levels, each a list of schemas sorted by subject
+    """
+    remaining = {x.subject_name: x for x in schemas}
+    levels = []
+    while remaining:
+        level = [
+            x
+            for x in remaining.values()
+            if not any(ref.subject in remaining for ref in x.references)
+        ]
+        if not level:
+            raise SchemaDependencyError(
+                f"Circular schema references between {', '.join(sorted(remaining))}"
+            )
+        level.sort(key=lambda x: x.subject_name)
+        levels.append(level)
+        for schema in level:
+            del remaining[schema.subject_name]
+    return levels
+
 
 class SchemaAdmin(object):
     """
     Manage schemas
     """
 
-    def __init__(self, sr_client):
+    def __init__(self, sr_client, max_workers=1, cache=None, compat_check=False):
+        """
+        :sr_client a SchemaRegistryClient
+        :max_workers max number of concurrent Schema Registry requests
+        :cache a SchemaFingerprintCache. An in-memory one is used if None
+        :compat_check check Avro schemas for compatibility with their prior
+        versions locally, before registering them
+        """
         self.client = sr_client
+        self.max_workers = max_workers
+        self.cache = cache or SchemaFingerprintCache()
+        self.compat_check = compat_check
+        # {subject: SubjectSnapshot}. None until load_snapshot is called
+        self.snapshot = None
+        # (subject prefixes, subjects or None) the snapshot was loaded for
+        self.snapshot_scope = None
+        # {subject: compatibility level or None if the subject has no
+        # override and uses the global level}
+        self.compatibility_map = {}
+        # {subject: latest version} seen in the registry during this run
+        self.latest_versions = {}
         self.subject_cache = []
         # plan is a dict with the following keys:
-        # 'subject' (name), 'schema': Schema obj, 'status': one of 'new' or
-        # 'updated'. 'compatibility': {"old":str, "new":str}
+        # 'subject' (name), 'schema': Schema obj, 'status': one of 'created',
+        # 'updated', 'compatibility' or 'failed'.
+        # 'compatibility': {"old":str, "new":str}, 'reason': str if failed
         self.dry_run_plan = {}
         self._populate_subject_cache()
         self.global_compat = self._get_global_compat()
@@ -47,18 +222,137 @@ class SchemaAdmin(object):
         """
         Geth the global compatibility setting of the schema registry
         """
-        global_compat = self.client.get_compatibility()["compatibilityLevel"].lower()
+        return _compat_level(self.client.get_compatibility())
+
+    def _get_subject_compat(self, subject: str):
+        """
+        Get the compatibility override of a subject. None if the subject uses
+        the global compatibility
+        """
+        try:
+            return _compat_level(self.client.get_compatibility(subject))
+        except SchemaRegistryError as e:
+            if e.http_status_code != 404:
+                print(f"Failed to get compatibility for {subject}: {e}")
+            return None
+
+    def load_compatibility(self, subjects: List[str]):
+        """
+        Load the compatibility levels of subjects that exist in the registry
+        into compatibility_map in a single concurrent pass.
+        """
+        subjects = [
+            x
+            for x in subjects
+            if x in self.subject_cache and x not in self.compatibility_map
+        ]
+        levels = self._map(self._get_subject_compat, subjects)
+        self.compatibility_map.update(zip(subjects, levels))
+        return self.compatibility_map
+
+    def get_compatibility(self, subject: str):
+        """
+        Return the effective compatibility level of a subject, using the
+        compatibility map
+        """
+        if subject not in self.compatibility_map:
+            self.compatibility_map[subject] = self._get_subject_compat(subject)
+        return self.compatibility_map[subject] or self.global_compat
 
     def _populate_subject_cache(self):
         """
         List all subjects and populate the subject name cache
         """
         self.subject_cache = self.client.get_subjects()
+        self.cache.invalidate(self.subject_cache)
         return self.subject_cache
 
     def get_dry_run_plan(self):
         return self.dry_run_plan
 
+    def _get_schemas_page(self, subject_prefix: str, offset: int, limit: int):
+        """
+        Get a page of the latest schemas of subjects starting with
+        subject_prefix using the registry's GET /schemas endpoint.
+        SchemaRegistryClient has no method for it so its REST client is used
+        """
+        return self.client._rest_client.get(
+            "schemas",
+            query={
+                "subjectPrefix": subject_prefix,
+                "latestOnly": "true",
+                "offset": offset,
+                "limit": limit,
+            },
+        )
+
+    def load_snapshot(self, subject_prefixes=None, subjects=None, page_size=1000):
+        """
+        Load the latest schema of every subject matching subject_prefixes in
+        a paginated sweep, instead of probing each subject individually.
+        Builds self.snapshot ({subject: SubjectSnapshot}) and fills the
+        fingerprint cache. Once loaded, subjects missing from the snapshot
+        are known not to exist without a registry request.
+        :subject_prefixes list of subject prefixes. Defaults to all subjects
+        :subjects if provided, only these subjects are kept in the snapshot
+        :page_size number of schemas requested per page
+        """
+        wanted = set(subjects) if subjects is not None else None
+        snapshot = {}
+        for prefix in subject_prefixes or [""]:
+            offset = 0
+            while True:
+                page = self._get_schemas_page(prefix, offset, page_size)
+                for registered in page:
+                    subject = registered["subject"]
+                    if wanted is not None and subject not in wanted:
+                        continue
+                    fingerprint = reference_fingerprint(
+                        canonical_fingerprint(registered["schema"]),
+                        [
+                            (x["name"], x["subject"], x["version"])
+                            for x in registered.get("references", None) or []
+                        ],
+                    )
+                    snapshot[subject] = SubjectSnapshot(
+                        registered["version"], registered["id"], fingerprint
+                    )
+                    self.latest_versions[subject] = registered["version"]
+                    self.cache.invalidate_versions(subject, registered["version"])
+                    self.cache.add_schema(
+                        subject,
+                        fingerprint,
+                        registered["version"],
+                        registered["schema"],
+                    )
+                if len(page) < page_size:
+                    break
+                offset += page_size
+        self.snapshot = snapshot
+        self.snapshot_scope = (subject_prefixes or [""], wanted)
+        return snapshot
+
+    def _snapshot_covers(self, subject: str):
+        """
+        True if a snapshot was loaded and it includes subject if it exists
+        """
+        if self.snapshot is None:
+            return False
+        prefixes, wanted = self.snapshot_scope
+        if wanted is not None and subject not in wanted:
+            return False
+        return any(subject.startswith(x) for x in prefixes)
+
+    def _map(self, func, items):
+        """
+        Apply func to each item using up to max_workers threads.
+        Returns the results in the order of items
+        """
+        if self.max_workers <= 1 or len(items) <= 1:
+            return [func(x) for x in items]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, items))
+
     def _add_to_plan(self, schema, data=None):
         """
         Add schema to plan.
@@ -67,7 +361,12 @@ class SchemaAdmin(object):
             self.dry_run_plan[schema.subject_name] = {
                 "schema": schema,
                 "status": "created",
+                "current_compatibility": None,
             }
+            if schema.subject_name in self.compatibility_map:
+                self.dry_run_plan[schema.subject_name]["current_compatibility"] = (
+                    self.get_compatibility(schema.subject_name)
+                )
         if data:
             self.dry_run_plan[schema.subject_name].update(data)
 
@@ -90,20 +389,147 @@ class SchemaAdmin(object):
         Lookup the schemas in the schema registry and if they already exist,
         exclude them
         """
-        missing_schemas = []
-        found_schemas = []
-        for schema in schemas:
-            # Does it exist (with same schema content?)
-            try:
-                found_schema = self.client.lookup_schema(
-                    schema.subject_name, schema.schema
-                )
-                found_schemas.append(found_schema)
-            except SchemaRegistryError:
-                # TODO make sure its a 404 and not some other error
+        # Does it exist (with same schema content?)
+        found = self._map(self.is_registered, schemas)
+        return [x for x, registered in zip(schemas, found) if not registered]
+
+    def _latest_version(self, subject: str):
+        """
+        Return the latest registered version of subject, or None if the
+        subject doesn't exist. Answered from the snapshot if it covers
+        subject, otherwise fetched once per run. The latest schema is
+        recorded in the fingerprint cache and newer cached versions are
+        dropped.
+        """
+        if subject in self.latest_versions:
+            return self.latest_versions[subject]
+        if self._snapshot_covers(subject) or subject not in self.subject_cache:
+            # Subjects in the snapshot are already in latest_versions
+            return None
+        try:
+            latest = self.client.get_latest_version(subject)
+        except SchemaRegistryError:
+            return None
+        self.latest_versions[subject] = latest.version
+        self.cache.invalidate_versions(subject, latest.version)
+        self.cache.add_schema(
+            subject,
+            registered_fingerprint(latest.schema),
+            latest.version,
+            latest.schema.schema_str,
+        )
+        return latest.version
+
+    def is_registered(self, schema: Schema):
+        """
+        True if the schema is already registered under its subject.
+        The fingerprint cache is checked first, but a cached version is only
+        trusted if the latest version of the subject (from the snapshot or
+        the registry) is at least that version. On a miss the registry is
+        asked, and if the exact text is not registered the latest version is
+        compared by canonical form, so formatting-only changes don't count.
+        """
+        subject = schema.subject_name
+        cached = self.cache.get_version(subject, schema.fingerprint)
+        if cached is not None:
+            latest = self._latest_version(subject)
+            if latest is not None and latest >= cached:
+                return True
+        if schema.has_unresolved_references():
+            # A referenced subject is not registered yet
+            return False
+        snapshot_covers = self._snapshot_covers(subject)
+        if snapshot_covers and subject not in self.snapshot:
+            return False
+        try:
+            registered = self.client.lookup_schema(subject, schema.schema)
+            self.cache.add(subject, schema.fingerprint, registered.version)
+            return True
+        except SchemaRegistryError:
+            # TODO make sure its a 404 and not some other error
+            pass
+        latest = self._latest_version(subject)
+        if latest is None:
+            return False
+        return self.cache.get_version(subject, schema.fingerprint) == latest
+
+    def get_prior_schemas(self, subject: str, transitive=False):
+        """
+        Return the texts of the registered versions of subject, oldest first.
+        Only the latest version is returned unless transitive is set.
+        Versions are read from the cache and fetched from the registry only
+        if missing.
+        """
+        cached = self.cache.get_versions(subject)
+        if transitive:
+            versions = sorted(self.client.get_versions(subject))
+        else:
+            versions = [self.latest_versions.get(subject, None)]
+        schemas = []
+        for version in versions:
+            if version in cached:
+                schemas.append(cached[version])
+                continue
+            if version is None:
+                registered = self.client.get_latest_version(subject)
+            else:
+                registered = self.client.get_version(subject, version)
+            schema_str = registered.schema.schema_str
+            self.cache.add_schema(
+                subject,
+                registered_fingerprint(registered.schema),
+                registered.version,
+                schema_str,
+            )
+            schemas.append(schema_str)
+        return schemas
+
+    def check_compatibility(self, schema: Schema):
+        """
+        Check an Avro schema against the prior versions of its subject using
+        the compatibility level it will be registered with.
+        Returns a list of reasons why it's incompatible (empty if compatible)
+        """
+        subject = schema.subject_name
+        if schema.schema_type != "AVRO" or subject not in self.subject_cache:
+            return []
+        if schema.references:
+            # Referenced named types are only known to the registry
+            return []
+        level = schema.compatibility or self.get_compatibility(subject)
+        if level == "none":
+            return []
+        try:
+            prior = self.get_prior_schemas(
+                subject, transitive=level.endswith("_transitive")
+            )
+            return check_compatibility(schema.schema_json, prior, level)
+        except SchemaRegistryError as e:
+            print(f"Failed to get prior versions of {subject}: {e}")
+            return []
+        except AvroSchemaError as e:
+            return [str(e)]
 
-                missing_schemas.append(schema)
-        return missing_schemas
+    def _reject_incompatible(self, schemas: List[Schema]):
+        """
+        Check schemas for compatibility concurrently. Incompatible schemas
+        are marked as failed in the plan.
+        Returns a tuple (compatible schemas, {subject: error})
+        """
+        results = self._map(self.check_compatibility, schemas)
+        compatible = []
+        failed = {}
+        for schema, reasons in zip(schemas, results):
+            if not reasons:
+                compatible.append(schema)
+                continue
+            reason = "; ".join(reasons)
+            print(f"Schema for {schema.subject_name} is incompatible: {reason}")
+            failed[schema.subject_name] = {
+                schema.subject_name: {"schema": schema, "reason": reason}
+            }
+            self._add_to_plan(schema, {"status": "failed", "reason": reason})
+        return (compatible, failed)
 
     def update_or_create_schema(self, schema: Schema, dry_run=False):
         """
@@ -113,6 +539,18 @@ class SchemaAdmin(object):
         try:
             if not dry_run:
                 self.client.register_schema(schema.subject_name, schema.schema)
+                # Cache the registered version so the entry can be checked
+                # against the latest version of the subject later
+                registered = self.client.lookup_schema(
+                    schema.subject_name, schema.schema
+                )
+                self.cache.add(
+                    schema.subject_name, schema.fingerprint, registered.version
+                )
+                self.latest_versions[schema.subject_name] = max(
+                    registered.version,
+                    self.latest_versions.get(schema.subject_name, None) or 0,
+                )
                 created = schema
             else:
                 status = "created"
@@ -128,50 +566,153 @@ class SchemaAdmin(object):
                 }
             }
             print(f"Error registering schema for {schema.subject_name}: {e}")
-            self._add_to_plan(schema, {"status": "failed"})
+            self._add_to_plan(schema, {"status": "failed", "reason": str(e)})
 
         return (created, error)
 
     def reconcile_schemas(self, schemas: List[Schema], dry_run=False):
         """
-        Iterate of the provided schemas and ensure they are as specified
+        Iterate of the provided schemas and ensure they are as specified.
+        Schemas are registered in dependency order: each level of the
+        reference graph is processed concurrently (up to max_workers) once
+        the subjects it references are registered. Results and plan entries
+        are ordered by subject name.
         :dry_run don't change anything but display what would happen
+        Returns a tuple (registered, failed_to_register)
+        """
+        schemas = sorted(schemas, key=lambda x: x.subject_name)
+        # Load all compatibility levels we need in one pass
+        self.load_compatibility([x.subject_name for x in schemas if x.compatibility])
+        failed_to_register = {}
+        registered = []
+        managed = {x.subject_name: x for x in schemas}
+        for level in dependency_levels(schemas):
+            level, failed = self._reject_failed_dependencies(level, failed_to_register)
+            failed_to_register.update(failed)
+            self._map(lambda x: self._resolve_references(x, managed), level)
+            created, failed = self._reconcile_level(level, dry_run=dry_run)
+            registered += created
+            failed_to_register.update(failed)
+        registered.sort(key=lambda x: x.subject_name)
+        self.dry_run_plan = dict(sorted(self.dry_run_plan.items()))
+        return (registered, failed_to_register)
+
+    def _reject_failed_dependencies(self, schemas: List[Schema], failed: dict):
+        """
+        Fail schemas that reference a subject that failed to register.
+        Returns a tuple (remaining schemas, {subject: error})
+        """
+        remaining = []
+        rejected = {}
+        for schema in schemas:
+            failed_refs = [x.subject for x in schema.references if x.subject in failed]
+            if not failed_refs:
+                remaining.append(schema)
+                continue
+            reason = f"Referenced subjects failed: {', '.join(failed_refs)}"
+            print(f"Skipping schema for {schema.subject_name}: {reason}")
+            rejected[schema.subject_name] = {
+                schema.subject_name: {"schema": schema, "reason": reason}
+            }
+            self._add_to_plan(schema, {"status": "failed", "reason": reason})
+        return (remaining, rejected)
+
+    def _resolve_references(self, schema: Schema, managed: dict):
+        """
+        Resolve the version of references declared without one into
+        schema.resolved_versions. Managed subjects resolve
+        to the version holding the declared schema, others to their latest
+        version. References stay unresolved if the subject is not registered
+        (only possible in dry run)
         """
+        for ref in schema.references:
+            if ref.version is not None:
+                continue
+            dependency = managed.get(ref.subject, None)
+            try:
+                if dependency is None:
+                    latest = self.client.get_latest_version(ref.subject)
+                    schema.resolved_versions[ref.name] = latest.version
+                    continue
+                version = self.cache.subjects.get(ref.subject, {}).get(
+                    dependency.fingerprint, None
+                )
+                if version is None and not dependency.has_unresolved_references():
+                    version = self.client.lookup_schema(
+                        ref.subject, dependency.schema
+                    ).version
+                    self.cache.add(ref.subject, dependency.fingerprint, version)
+                if version is not None:
+                    schema.resolved_versions[ref.name] = version
+            except SchemaRegistryError as e:
+                if e.http_status_code != 404:
+                    print(f"Failed to resolve reference {ref.subject}: {e}")
 
+    def _reconcile_level(self, schemas: List[Schema], dry_run=False):
+        """
+        Reconcile schemas that don't depend on each other.
+        Returns a tuple (registered, failed_to_register)
+        """
         update_subjects = self.get_subjects_to_update(schemas)
+        # Unchanged schemas may still need a compatibility change
+        unchanged = set(schemas) - set(update_subjects)
+        compat_changes = [
+            x
+            for x in schemas
+            if x in unchanged
+            and x.compatibility
+            and x.subject_name in self.subject_cache
+            and self.get_compatibility(x.subject_name) != x.compatibility
+        ]
+        self._map(
+            lambda x: self._reconcile_compatibility(x, dry_run=dry_run),
+            compat_changes,
+        )
 
         # Create missing schemas
         failed_to_register = {}
         registered = []
-        for schema in update_subjects:
-            # Set compatibility before registering to ensure we don't get
-            # compatibility errors if compat has changed.
-            self.set_compatibility(schema, dry_run=dry_run)
-            # Register schema
-            created, error = self.update_or_create_schema(schema, dry_run=dry_run)
+        if self.compat_check:
+            update_subjects, failed_to_register = self._reject_incompatible(
+                update_subjects
+            )
+        results = self._map(
+            lambda x: self._reconcile_schema(x, dry_run=dry_run), update_subjects
+        )
+        for schema, (created, error) in zip(update_subjects, results):
             if created:
                 registered.append(created)
             if error:
                 failed_to_register.update({schema.subject_name: error})
+        return (registered, failed_to_register)
+
+    def _reconcile_compatibility(self, schema: Schema, dry_run=False):
+        """
+        Set the compatibility of a schema that is already registered
+        """
+        self.set_compatibility(schema, dry_run=dry_run)
+        if dry_run:
+            self._add_to_plan(schema, {"status": "compatibility"})
+
+    def _reconcile_schema(self, schema: Schema, dry_run=False):
+        """
+        Set the compatibility and register a single schema
+        """
+        # Set compatibility before registering to ensure we don't get
+        # compatibility errors if compat has changed.
+        self.set_compatibility(schema, dry_run=dry_run)
+        # Register schema
+        return self.update_or_create_schema(schema, dry_run=dry_run)
 
     def set_compatibility(self, schema: Schema, dry_run=False):
         """
         Set compatibility level for a Schema, if needed
         """
-        global_compat = self.global_compat
-        # per_subject_override_exists = False
         # Set compatibility of specified
         if schema.compatibility and schema.subject_name in self.subject_cache:
             compat = schema.compatibility
             # First get the compatiblity
-            try:
-                current_compat = self.client.get_compatibility(schema.subject_name)[
-                    "compatibilityLevel"
-                ].lower()
-                # per_subject_override_exists = True
-            except SchemaRegistryError as e:
-                print(f"Got error {e}")
-                current_compat = global_compat
+            current_compat = self.get_compatibility(schema.subject_name)
 
             if current_compat != compat:
                 print(
@@ -180,11 +721,12 @@ class SchemaAdmin(object):
                 try:
                     if not dry_run:
                         self.client.set_compatibility(schema.subject_name, level=compat)
+                        self.compatibility_map[schema.subject_name] = compat
                     else:
                         print("compat differ. add to plan")
                         self._add_to_plan(
                             schema,
-                            {"compatiblity": {"old": current_compat, "new": compat}},
+                            {"compatibility": {"old": current_compat, "new": compat}},
                         )
                 except SchemaRegistryError as e:
                     print(
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+
+def _hash(data):
+    """
+    Return a stable sha256 hex digest of a JSON serializable structure
+    """
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def topic_fingerprint(topic):
+    return _hash(
+        {
+            "name": topic.name,
+            "partitions": topic.partitions,
+            "replication_factor": topic.replication_factor,
+            "configs": topic.configs,
+        }
+    )
+
+
+def schema_fingerprint(schema):
+    return _hash(
+        {
+            "subject": schema.subject_name,
+            "schema": schema.schema_json,
+            "compatibility": schema.compatibility,
+            "schema_type": schema.schema_type,
+            "references": [[x.name, x.subject, x.version] for x in schema.references],
+        }
+    )
+
+
+def client_fingerprint(client):
+    # The rolebindings of a client are fully determined by its declaration
+    return _hash(
+        {
+            "principal": client.principal,
+            "consumer_for": client.consumer_for,
+            "producer_for": client.producer_for,
+            "resourceowner_for": client.resourceowner_for,
+            "groups": client.groups,
+        }
+    )
+
+
+class StateStore(object):
+    """
+    Persistent record of the resources that were successfully applied.
+    For each resource we keep a content hash of its declaration and the time
+    it was applied. Resources whose hash is unchanged and that were applied
+    less than `ttl` seconds ago can be skipped by sync.
+    """
+
+    TOPICS = "topics"
+    SCHEMAS = "schemas"
+    CLIENTS = "clients"
+
+    # kind: (function returning the resource name, fingerprint function)
+    KINDS = {
+        TOPICS: (lambda x: x.name, topic_fingerprint),
+        SCHEMAS: (lambda x: x.subject_name, schema_fingerprint),
+        CLIENTS: (lambda x: x.principal, client_fingerprint),
+    }
+
+    def __init__(self, filename, ttl=None):
+        """
+        :filename the state file. Created on save if it does not exist
+        :ttl seconds after which a resource is verified again even if it did
+        not change. None means never.
+        """
+        self.filename = Path(filename)
+        self.ttl = ttl
+        self.state = self._load()
+
+    def _load(self):
+        state = {kind: {} for kind in self.KINDS}
+        if not self.filename.exists():
+            return state
+        try:
+            with open(self.filename, "r") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable state file {self.filename}: {e}")
+            return state
+        for kind in self.KINDS:
+            state[kind].update(data.get(kind, {}))
+        return state
+
+    def is_unchanged(self, kind: str, item, now=None):
+        """
+        True if item was applied with the same content and is not expired
+        """
+        name_func, fingerprint_func = self.KINDS[kind]
+        entry = self.state[kind].get(name_func(item), None)
+        if not entry or entry["hash"] != fingerprint_func(item):
+            return False
+        if self.ttl is None:
+            return True
+        now = now or time.time()
+        return now - entry["applied_at"] < self.ttl
+
+    def filter_changed(self, kind: str, items, now=None):
+        """
+        Return the items that need to be reconciled
+        """
+        if not items:
+            return items
+        return [x for x in items if not self.is_unchanged(kind, x, now=now)]
+
+    def record(self, kind: str, items, now=None):
+        """
+        Record items as successfully applied
+        """
+        name_func, fingerprint_func = self.KINDS[kind]
+        now = now or time.time()
+        for item in items or []:
+            self.state[kind][name_func(item)] = {
+                "hash": fingerprint_func(item),
+                "applied_at": now,
+            }
+
+    def save(self):
+        """
+        Write the state file atomically
+        """
+        if self.filename.parent:
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp_filename = self.filename.with_name(self.filename.name + ".tmp")
+        with open(tmp_filename, "w") as fp:
+            json.dump(self.state, fp, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
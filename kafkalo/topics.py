@@ -1,6 +1,16 @@
-from confluent_kafka.admin import NewTopic, ConfigResource
+from confluent_kafka.admin import (
+    NewTopic,
+    NewPartitions,
+    ConfigResource,
+    ConfigEntry,
+    ConfigSource,
+    AlterConfigOpType,
+)
 from confluent_kafka import KafkaException
 from typing import List
+from kafkalo.utils import chunks
+from kafkalo.placement import ReplicaPlacer, PlacementError
+from kafkalo.reassignment import ReassignmentPlanner
 
 Type = ConfigResource.Type
 
@@ -24,19 +34,82 @@ class KafkaAdmin(object):
     Can manage topics
     """
 
-    def __init__(self, adminclient, consumer):
+    # Right now we will remove the following keys as we have run into an
+    # issue where the broker respond with these in the existing config but
+    # will not recogize them sent back.
+    # This is not needed in incremental mode, where only changed keys are
+    # sent.
+    banned_settings = [
+        "confluent.ssl.truststore.password",
+        "confluent.ssl.truststore.location",
+    ]
+
+    def __init__(
+        self,
+        adminclient,
+        consumer,
+        batch_size=500,
+        incremental=False,
+        delete_unmanaged_configs=False,
+        balanced_placement=False,
+        reassignment_wave_size=10,
+        reassignment_throttle=None,
+        partition_sizes=None,
+    ):
         """
         :adminclient is an instance of kafka AdminClient
         :adminclient is an instance of kafka Consumer
+        :batch_size max number of resources sent in a single admin request
+        :incremental use incremental_alter_configs and only send the changed
+        configs instead of replacing the whole topic config
+        :delete_unmanaged_configs in incremental mode, delete dynamic topic
+        configs that are not declared in the YAML
+        :balanced_placement compute explicit replica assignments for new
+        partitions that spread replicas evenly across brokers and racks
+        :reassignment_wave_size max number of partitions reassigned at the
+        same time when the replication factor of a topic changes
+        :reassignment_throttle replication throttle (bytes/sec) to use for
+        reassignments
+        :partition_sizes optional dict of (topic, partition) to size in bytes
+        used to estimate the data moved by reassignments
         """
         self.adminclient = adminclient
         self.consumer = consumer
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.delete_unmanaged_configs = delete_unmanaged_configs
+        self.balanced_placement = balanced_placement
+        self.reassignment_wave_size = reassignment_wave_size
+        self.reassignment_throttle = reassignment_throttle
+        self.partition_sizes = partition_sizes
+        # The ReassignmentPlanner of the last reconcile_topics run
+        self.reassignment_planner = None
         self.topics_cache = []
+        # {topic_name: {config_name: ConfigEntry}} as returned by
+        # describe_configs. Populated once per reconcile_topics run
+        self.config_snapshot = {}
         self.dry_run_plan = {}
 
     def get_dry_run_plan(self):
         return self.dry_run_plan
 
+    def get_failed_topic_names(self):
+        """
+        Return the names of topics in the plan that could not be fully
+        reconciled. Replication factor changes are only planned, so these
+        topics are included as well.
+        """
+        failed = set()
+        for topic_name, data in self.dry_run_plan.items():
+            if (
+                data.get("create", None) == "failed"
+                or data.get("configs_failed", None)
+                or data.get("partitions_failed", None)
+                or data.get("replication_factor_delta", None)
+            ):
+                failed.add(topic_name)
+        return failed
+
     def list_topics(self):
         """
         Retrieve list of topics from Kafka
@@ -57,7 +130,7 @@ class KafkaAdmin(object):
         changes = {}
         for key in after.keys():
             if key not in before:
-                changes[key] = after[key]
+                changes[key] = {"before": None, "after": after[key]}
             else:
                 if str(after[key]).strip() != str(before[key]).strip():
                     changes[key] = {"before": before[key], "after": after[key]}
@@ -66,7 +139,7 @@ class KafkaAdmin(object):
     def reconcile_topics(self, topics: List[Topic], dry_run=False, strict=False):
         """
         Reconcile configuration
-        Create missing topics, and update configs.
+        Create missing topics, add partitions and update configs.
         :dry_run will not update anything
         """
         current_medatada = self.list_topics()
@@ -75,34 +148,94 @@ class KafkaAdmin(object):
         new_topic_names = topic_names - existing_topic_names
         # skipped_topic_names = existing_topic_names & topic_names
         topics_to_create = [x for x in topics if x.name in new_topic_names]
+        # Share the placer so that new topics and new partitions are balanced
+        # against each other too
+        placer = None
+        if self.balanced_placement:
+            placer = self._get_placer(current_medatada)
 
         topics_created, topics_failed = self.create_topics(
-            topics_to_create, dry_run=dry_run
+            topics_to_create, dry_run=dry_run, placer=placer
+        )
+        # Grow partitions of existing topics if needed
+        self.increase_partitions(
+            [x for x in topics if x.name in existing_topic_names],
+            current_medatada,
+            dry_run=dry_run,
+            placer=placer,
+        )
+        # Replication factor changes need reassignments. Plan them
+        self.plan_replication_factor_changes(
+            [x for x in topics if x.name in existing_topic_names], current_medatada
         )
 
-        # now alter configs
-        for topic in topics:
-            if topic.name in topics_failed:
-                continue
-            if topic.configs:
-                self.alter_config_for_topic(topic, dry_run=dry_run)
+        # Fetch the existing configs of all the topics we manage in bulk so
+        # that we don't do a describe round trip per topic.
+        # Topics that are to be created in dry-run mode don't exist yet so
+        # there is nothing to describe.
+        skip_describe = set(topics_failed.keys())
+        if dry_run:
+            skip_describe |= new_topic_names
+        # Topics without configs have nothing to change, unless unmanaged
+        # configs are deleted
+        managed = [x for x in topics if x.configs or self.delete_unmanaged_configs]
+        self.config_snapshot = self.describe_topics_configs(
+            [x.name for x in managed if x.name not in skip_describe]
+        )
+        # now alter configs of the topics that actually changed
+        self.alter_topics_configs(
+            [x for x in managed if x.name not in topics_failed],
+            self.config_snapshot,
+            dry_run=dry_run,
+        )
         # TODO If strict mode. delete topics not present in list.
         # Add param --zero-fucks-given to do that without user prompt to verify
         return (topics_created, topics_failed)
 
-    def create_topics(self, topics: List[Topic], dry_run=None):
+    def _get_broker_racks(self):
+        """
+        Return a dict of broker id to rack for brokers that have a rack set
+        """
+        try:
+            cluster = self.adminclient.describe_cluster(request_timeout=30).result()
+        except Exception as e:
+            print(f"Failed to describe cluster. Racks will be ignored: {e}")
+            return {}
+        return {node.id: node.rack for node in cluster.nodes if node.rack}
+
+    def _get_placer(self, metadata):
+        """
+        Return a ReplicaPlacer loaded with the brokers and replicas in metadata
+        """
+        return ReplicaPlacer(metadata, racks=self._get_broker_racks())
+
+    def _make_new_topic(self, topic: Topic, placer=None):
+        """
+        Return a NewTopic for topic. If a placer is provided the replica
+        assignment is set explicitly, otherwise the controller decides.
+        """
+        if placer:
+            try:
+                assignment = placer.assign(topic.partitions, topic.replication_factor)
+                return NewTopic(topic.name, replica_assignment=assignment)
+            except PlacementError as e:
+                print(f"Can't compute replica assignment for {topic.name}: {e}")
+        return NewTopic(topic.name, topic.partitions, topic.replication_factor)
+
+    def create_topics(self, topics: List[Topic], dry_run=None, placer=None):
         """
         Create topics
+        :placer optional ReplicaPlacer. If not provided and balanced_placement
+        is enabled, one is created from the current cluster metadata.
         """
         if not topics:
             return ({}, {})
+        if placer is None and self.balanced_placement:
+            placer = self._get_placer(self.list_topics())
         # Lets create a dictionary of topic_name:Topic obj to make lookups
         # easier
         topics_dict = {x.name: x for x in topics}
-        new_topics = [
-            NewTopic(topic.name, topic.partitions, topic.replication_factor)
-            for topic in topics
-        ]
+        new_topics = [self._make_new_topic(topic, placer) for topic in topics]
         # we get back a dict of {topic: future} that we can call the result on
         fs = self.adminclient.create_topics(
             new_topics, operation_timeout=10, validate_only=dry_run
@@ -136,6 +269,141 @@ class KafkaAdmin(object):
 
         return (topics_created, topics_failed)
 
+    def increase_partitions(
+        self, topics: List[Topic], metadata, dry_run=False, placer=None
+    ):
+        """
+        Add partitions to existing topics whose partition count was increased.
+        Requests are sent in chunks of batch_size topics.
+        Kafka can't decrease partitions so such topics are marked as failed
+        in the plan.
+        :topics a list of Topic instances that already exist
+        :metadata the ClusterMetadata as returned by list_topics
+        :dry_run only validate the requests
+        :placer optional ReplicaPlacer used to assign the new partitions
+        Returns a tuple of dicts (partitions_altered, partitions_failed)
+        keyed by topic name
+        """
+        partitions_altered = {}
+        partitions_failed = {}
+        topics_dict = {}
+        new_partitions = []
+        if placer is None and self.balanced_placement:
+            placer = self._get_placer(metadata)
+        for topic in topics:
+            partitions = metadata.topics[topic.name].partitions
+            current = len(partitions)
+            if topic.partitions == current:
+                continue
+            topics_dict[topic.name] = topic
+            self._update_plan(
+                topic.name,
+                {
+                    "topic": topic,
+                    "reason": None,
+                    "partitions_delta": {"before": current, "after": topic.partitions},
+                    "partitions_failed": None,
+                },
+            )
+            if topic.partitions < current:
+                reason = "Number of partitions can't be decreased"
+                partitions_failed[topic.name] = {"topic": topic, "reason": reason}
+                self._update_plan(topic.name, {"partitions_failed": reason})
+                continue
+            new_partitions.append(self._make_new_partitions(topic, partitions, placer))
+
+        futures = {}
+        for chunk in chunks(new_partitions, self.batch_size):
+            futures.update(
+                self.adminclient.create_partitions(
+                    chunk, operation_timeout=30, validate_only=dry_run
+                )
+            )
+        for topic_name, future in futures.items():
+            topic = topics_dict[topic_name]
+            try:
+                future.result()
+                partitions_altered[topic_name] = topic
+            except Exception as e:
+                partitions_failed[topic_name] = {"topic": topic, "reason": str(e)}
+                self._update_plan(topic_name, {"partitions_failed": str(e)})
+        return (partitions_altered, partitions_failed)
+
+    def plan_replication_factor_changes(self, topics: List[Topic], metadata):
+        """
+        Plan the replica reassignments of existing topics whose replication
+        factor changed and record them, along with the under-replicated
+        partitions of each topic, in the plan.
+        The reassignments themselves are not executed. The planner (also
+        kept in self.reassignment_planner) can write them as waves.
+        :topics a list of Topic instances that already exist
+        :metadata the ClusterMetadata as returned by list_topics
+        Returns the ReassignmentPlanner
+        """
+        changed = []
+        for topic in topics:
+            partitions = metadata.topics[topic.name].partitions
+            if not partitions:
+                continue
+            current = len(next(iter(partitions.values())).replicas)
+            if current != topic.replication_factor:
+                changed.append(topic)
+        racks = self._get_broker_racks() if changed else {}
+        planner = ReassignmentPlanner(
+            metadata,
+            racks=racks,
+            wave_size=self.reassignment_wave_size,
+            throttle=self.reassignment_throttle,
+            partition_sizes=self.partition_sizes,
+        )
+        if self.reassignment_planner:
+            # Keep the moves planned by previous calls (input chunks)
+            planner.moves = self.reassignment_planner.moves
+        for topic in topics:
+            under_replication = planner.under_replication(topic.name)
+            if under_replication["partitions_under_replicated"]:
+                self._update_plan(
+                    topic.name,
+                    {
+                        "topic": topic,
+                        "reason": None,
+                        "under_replication": under_replication,
+                    },
+                )
+        for topic in changed:
+            self._update_plan(
+                topic.name,
+                {
+                    "topic": topic,
+                    "reason": None,
+                    "replication_factor_delta": planner.plan_topic(
+                        topic.name, topic.replication_factor
+                    ),
+                },
+            )
+        self.reassignment_planner = planner
+        return planner
+
+    def _make_new_partitions(self, topic: Topic, partitions: dict, placer=None):
+        """
+        Return a NewPartitions for topic. If a placer is provided the replica
+        assignment of the added partitions is set explicitly, using the
+        current replication factor of the topic.
+        """
+        if placer and partitions:
+            current = len(partitions)
+            replication_factor = len(next(iter(partitions.values())).replicas)
+            try:
+                assignment = placer.assign(
+                    topic.partitions - current, replication_factor
+                )
+                return NewPartitions(
+                    topic.name, topic.partitions, replica_assignment=assignment
+                )
+            except PlacementError as e:
+                print(f"Can't compute replica assignment for {topic.name}: {e}")
+        return NewPartitions(topic.name, topic.partitions)
+
     def _update_plan(self, topic: str, data: dict):
         """
         Update the plan for this topic with data dict
@@ -150,71 +418,188 @@ class KafkaAdmin(object):
         Perform some basic sanity checks on the topic config and
         return a sanitized config dictionary
         """
-        # Right now we will remove the following keys as we have run into an
-        # issue where the broker respond with these in the existing config but
-        # will not recogize them sent back.
-        banned_settings = [
-            "confluent.ssl.truststore.password",
-            "confluent.ssl.truststore.location",
-        ]
-        for setting in banned_settings:
+        for setting in self.banned_settings:
             if setting in config:
                 del config[setting]
         return config
 
-    def alter_config_for_topic(
-        self, topic: Topic, dry_run=False, respect_existing_config=False
+    def _make_config_change(
+        self, topic: Topic, existing_configs: dict, respect_existing_config=False
     ):
         """
-        Alter the configuration of a single topic.
+        Compute the new configuration of a topic.
+        Returns a tuple (ConfigResource, config_delta)
         :topic a Topic instance
+        :existing_configs the configs of the topic as returned by describe_topic
         :respect_existing_config merge existing conig into new
-        :dry_run perform dry-run only
         """
-
+        if self.incremental:
+            return self._make_incremental_config_change(topic, existing_configs)
         new_config = {}
-        # First get existing configs.. so really "old config" at this stage
+        # existing configs.. so really "old config" at this stage
         existing_config = {
-            val.name: val.value
-            for (key, val) in self.describe_topic(topic.name).items()
+            val.name: val.value for (key, val) in existing_configs.items()
         }
         if respect_existing_config:
             new_config.update(existing_config)
         # And update with changed values to get real new config
-        new_config.update(topic.configs)
+        new_config.update(topic.configs or {})
         new_config = self._sanitize_topic_config(new_config)
         # get a config delta
         config_delta = self._get_config_diff(existing_config, new_config)
+        # alter_configs replaces the whole config, so dynamic topic configs
+        # removed from the topic definition are reset too
+        for name, entry in existing_configs.items():
+            if name in new_config or name in self.banned_settings:
+                continue
+            if ConfigSource(entry.source) != ConfigSource.DYNAMIC_TOPIC_CONFIG:
+                continue
+            config_delta[name] = {"before": entry.value, "after": None}
 
         resource = ConfigResource(restype=Type.TOPIC, name=topic.name)
         for key, value in new_config.items():
             resource.set_config(key, value)
-        fs = self.adminclient.alter_configs(
-            [resource], request_timeout=30, validate_only=dry_run
-        )
-        # check result
+        return (resource, config_delta)
 
-        configs_altered = []
-        configs_failed = {}
-        for res, future in fs.items():
+    def _make_incremental_config_change(self, topic: Topic, existing_configs: dict):
+        """
+        Compute the changed configs of a topic as incremental operations.
+        Only keys that differ are SET. If delete_unmanaged_configs is enabled,
+        dynamic topic configs missing from the topic definition are DELETEd.
+        Returns a tuple (ConfigResource, config_delta)
+        """
+        existing_config = {
+            val.name: val.value for (key, val) in existing_configs.items()
+        }
+        configs = topic.configs or {}
+        config_delta = self._get_config_diff(existing_config, configs)
+        if self.delete_unmanaged_configs:
+            for name, entry in existing_configs.items():
+                if name in configs:
+                    continue
+                if ConfigSource(entry.source) != ConfigSource.DYNAMIC_TOPIC_CONFIG:
+                    continue
+                config_delta[name] = {"before": entry.value, "after": None}
+
+        resource = ConfigResource(restype=Type.TOPIC, name=topic.name)
+        for key, diff in config_delta.items():
+            if diff["after"] is None:
+                entry = ConfigEntry(
+                    key, None, incremental_operation=AlterConfigOpType.DELETE
+                )
+            else:
+                entry = ConfigEntry(
+                    key,
+                    str(diff["after"]),
+                    incremental_operation=AlterConfigOpType.SET,
+                )
+            resource.add_incremental_config(entry)
+        return (resource, config_delta)
+
+    def _send_alter_configs(self, resources: List[ConfigResource], dry_run=False):
+        """
+        Send alter_configs (or incremental_alter_configs in incremental mode)
+        requests in chunks of batch_size resources.
+        Returns a dict of topic name to error (None if successful)
+        """
+        alter_configs = self.adminclient.alter_configs
+        if self.incremental:
+            alter_configs = self.adminclient.incremental_alter_configs
+        futures = {}
+        for chunk in chunks(resources, self.batch_size):
+            futures.update(
+                alter_configs(chunk, request_timeout=30, validate_only=dry_run)
+            )
+        results = {}
+        for res, future in futures.items():
             try:
                 future.result()
-                configs_altered.append(res)
+                results[res.name] = None
             except Exception as e:
-                configs_failed[res] = str(e)
+                results[res.name] = str(e)
+        return results
+
+    def _update_config_plan(self, topic: Topic, config_delta: dict, error=None):
+        """
+        Record the result of a config alteration in the plan
+        """
         if topic.name not in self.dry_run_plan:
-            self._update_plan(
-                topic.name,
-                {
-                    "topic": topic,
-                    "reason": None,
-                    "config_delta": config_delta,
-                },
-            )
+            self._update_plan(topic.name, {"topic": topic, "reason": None})
+        configs_altered = []
+        configs_failed = {}
+        if error is None:
+            configs_altered.append(topic.name)
+        else:
+            configs_failed[topic.name] = error
         self._update_plan(
             topic.name,
-            {"configs_altered": configs_altered, "configs_failed": configs_failed},
+            {
+                "config_delta": config_delta,
+                "configs_altered": configs_altered,
+                "configs_failed": configs_failed,
+            },
         )
+
+    def alter_topics_configs(
+        self, topics: List[Topic], existing_configs: dict, dry_run=False
+    ):
+        """
+        Alter the configuration of many topics.
+        Deltas are computed for all topics first and topics without changes
+        are skipped. The rest are sent as chunked multi-resource requests.
+        :topics a list of Topic instances
+        :existing_configs dict of topic name to configs (as returned by
+        describe_topics_configs)
+        :dry_run perform dry-run only
+        Returns a dict of topic name to config_delta for the altered topics
+        """
+        resources = []
+        deltas = {}
+        for topic in topics:
+            resource, config_delta = self._make_config_change(
+                topic, existing_configs.get(topic.name, {})
+            )
+            if not config_delta:
+                continue
+            resources.append(resource)
+            deltas[topic.name] = config_delta
+        results = self._send_alter_configs(resources, dry_run=dry_run)
+        for topic in topics:
+            if topic.name in deltas:
+                self._update_config_plan(
+                    topic, deltas[topic.name], results.get(topic.name, None)
+                )
+        return deltas
+
+    def alter_config_for_topic(
+        self,
+        topic: Topic,
+        dry_run=False,
+        respect_existing_config=False,
+        existing_configs=None,
+    ):
+        """
+        Alter the configuration of a single topic.
+        :topic a Topic instance
+        :respect_existing_config merge existing conig into new
+        :dry_run perform dry-run only
+        :existing_configs the configs of the topic as returned by
+        describe_topic. If None, they will be fetched from the cluster.
+        """
+        if existing_configs is None:
+            existing_configs = self.describe_topic(topic.name)
+        resource, config_delta = self._make_config_change(
+            topic, existing_configs, respect_existing_config
+        )
+        results = self._send_alter_configs([resource], dry_run=dry_run)
+        configs_altered = []
+        configs_failed = {}
+        for name, error in results.items():
+            if error is None:
+                configs_altered.append(name)
+            else:
+                configs_failed[name] = error
+        self._update_config_plan(topic, config_delta, results.get(topic.name, None))
         return (configs_altered, configs_failed, config_delta)
 
     def describe_topic(self, topic: str):
@@ -237,6 +622,29 @@ class KafkaAdmin(object):
                 print(f"Failed to to describe config for {res} with error {e}")
                 return {}
 
+    def describe_topics_configs(self, topic_names: List[str]):
+        """
+        Return a dictionary of topic name to configs (as returned by
+        describe_topic) for all provided topic names.
+        Resources are sent in chunks of batch_size and all requests are
+        issued before any future is waited on, so the round trips overlap.
+        Topics that could not be described map to an empty dict.
+        """
+        futures = {}
+        for chunk in chunks(topic_names, self.batch_size):
+            resources = [ConfigResource(restype=Type.TOPIC, name=x) for x in chunk]
+            futures.update(
+                self.adminclient.describe_configs(resources, request_timeout=30)
+            )
+        snapshot = {}
+        for res, future in futures.items():
+            try:
+                snapshot[res.name] = future.result()
+            except KafkaException as e:
+                print(f"Failed to to describe config for {res} with error {e}")
+                snapshot[res.name] = {}
+        return snapshot
+
     def delete_topics(self, topics: List[Topic], dry_run=False):
         """
         Delete topics from a list
@@ -0,0 +1,99 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses worth retrying: rate limiting and server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Lookups are read only POSTs, safe to send again
+LOOKUP_PATH = "/security/1.0/lookup/"
+
+
+class MDSTransport(object):
+    """
+    HTTP transport for the Confluent Metadata Service (MDS).
+    A single requests Session is shared by all calls so connections are kept
+    alive and pooled. Requests time out and are retried with exponential
+    backoff on connection errors, 429 and 5xx responses (honouring
+    Retry-After). POSTs are only retried that way for lookups: a rolebinding
+    POST is retried if it couldn't connect, but not after a 5xx or a read
+    timeout, since MDS may have applied it already.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        auth=None,
+        connect_timeout=5,
+        timeout=30,
+        retries=5,
+        backoff_factor=0.5,
+        pool_size=10,
+    ):
+        """
+        :url the MDS url
+        :auth (username, password) tuple
+        :connect_timeout seconds to wait for a connection
+        :timeout seconds to wait for a response
+        :retries max number of retries of a request
+        :backoff_factor retries wait backoff_factor * 2 ** (retry - 1) seconds
+        :pool_size max number of connections kept alive
+        """
+        self.url = url.rstrip("/")
+        self.timeout = (connect_timeout, timeout)
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=self.retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        lookup_adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=self.retry.new(
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"}
+            ),
+        )
+        self.session.mount(self.url + LOOKUP_PATH, lookup_adapter)
+
+    @classmethod
+    def from_config(cls, mds_config: dict):
+        """
+        Create a transport from the mds connection config
+        """
+        return cls(
+            mds_config["url"],
+            auth=(mds_config["username"], mds_config["password"]),
+            connect_timeout=float(mds_config.get("connect-timeout", 5)),
+            timeout=float(mds_config.get("timeout", 30)),
+            retries=int(mds_config.get("retries", 5)),
+            backoff_factor=float(mds_config.get("backoff-factor", 0.5)),
+            pool_size=int(mds_config.get("pool-size", 10)),
+        )
+
+    def request(self, method: str, path: str, **kwargs):
+        """
+        Send a request to path (relative to the MDS url) and return the
+        Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.url + path, **kwargs)
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,16 @@
+from itertools import islice
+
+
+def chunks(items, size: int):
+    """
+    Split an iterable into lists of at most `size` items.
+    Works with lists as well as generators.
+    """
+    if size < 1:
+        raise ValueError(f"Chunk size must be a positive number. Got {size}")
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
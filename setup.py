@@ -17,6 +17,8 @@ with open("HISTORY.rst") as history_file:
 requirements = [
     "Click>=7.0",
     "requests>=2.0",
+    # Retry(allowed_methods=...) used by the MDS transport
+    "urllib3>=1.26",
     "pyyaml",
     "environs",
     "jinja2",
@@ -0,0 +1,200 @@
+from concurrent.futures import Future
+from confluent_kafka import KafkaException, KafkaError, Node
+from confluent_kafka.admin import (
+    ClusterMetadata,
+    TopicMetadata,
+    PartitionMetadata,
+    BrokerMetadata,
+    ConfigEntry,
+    ConfigSource,
+    DescribeClusterResult,
+    AlterConfigOpType,
+)
+
+
+def _done(result=None, exception=None):
+    future = Future()
+    if exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def _unknown_topic(name):
+    return KafkaException(
+        KafkaError(KafkaError.UNKNOWN_TOPIC_OR_PART, f"Topic {name} does not exist")
+    )
+
+
+class MockAdminClient(object):
+    """
+    Mock Kafka AdminClient. Keeps topics in memory and counts requests.
+    """
+
+    def __init__(self, brokers=3, racks=None):
+        # {'topic_name': {'partitions': 6, 'configs': {'retention.ms': '100'}}}
+        self.topics = {}
+        self.brokers = brokers
+        # {broker_id: rack}
+        self.racks = racks or {}
+        # {'describe_configs': [number of resources per request]}
+        self.requests = {}
+
+    def _record(self, method, count):
+        self.requests.setdefault(method, []).append(count)
+
+    def add_topic(
+        self,
+        name,
+        partitions=1,
+        replication_factor=1,
+        configs=None,
+        replica_assignment=None,
+    ):
+        if replica_assignment is None:
+            replica_assignment = [
+                [
+                    (partition_id + x) % self.brokers + 1
+                    for x in range(replication_factor)
+                ]
+                for partition_id in range(partitions)
+            ]
+        self.topics[name] = {
+            "partitions": partitions,
+            "replication_factor": replication_factor,
+            "replica_assignment": replica_assignment,
+            "configs": dict(configs or {}),
+        }
+
+    def describe_cluster(self, request_timeout=None):
+        self._record("describe_cluster", 1)
+        nodes = [
+            Node(broker_id, "localhost", 9092, rack=self.racks.get(broker_id))
+            for broker_id in range(1, self.brokers + 1)
+        ]
+        return _done(DescribeClusterResult(controller=nodes[0], nodes=nodes))
+
+    def list_topics(self):
+        self._record("list_topics", 1)
+        metadata = ClusterMetadata()
+        for broker_id in range(1, self.brokers + 1):
+            broker = BrokerMetadata()
+            broker.id = broker_id
+            metadata.brokers[broker_id] = broker
+        for name, data in self.topics.items():
+            topic = TopicMetadata()
+            topic.topic = name
+            for partition_id in range(data["partitions"]):
+                partition = PartitionMetadata()
+                partition.id = partition_id
+                replicas = data["replica_assignment"][partition_id]
+                partition.leader = replicas[0]
+                partition.replicas = replicas
+                partition.isrs = list(replicas)
+                topic.partitions[partition_id] = partition
+            metadata.topics[name] = topic
+        return metadata
+
+    def create_topics(self, new_topics, operation_timeout=None, validate_only=False):
+        self._record("create_topics", len(new_topics))
+        fs = {}
+        for new_topic in new_topics:
+            if new_topic.topic in self.topics:
+                fs[new_topic.topic] = _done(
+                    exception=KafkaException(
+                        KafkaError(
+                            KafkaError.TOPIC_ALREADY_EXISTS,
+                            f"Topic {new_topic.topic} already exists",
+                        )
+                    )
+                )
+                continue
+            if not validate_only:
+                if new_topic.replica_assignment:
+                    assignment = new_topic.replica_assignment
+                    self.add_topic(
+                        new_topic.topic,
+                        len(assignment),
+                        len(assignment[0]),
+                        replica_assignment=assignment,
+                    )
+                else:
+                    self.add_topic(
+                        new_topic.topic,
+                        new_topic.num_partitions,
+                        new_topic.replication_factor,
+                    )
+            fs[new_topic.topic] = _done()
+        return fs
+
+    def create_partitions(
+        self, new_partitions, operation_timeout=None, validate_only=False
+    ):
+        self._record("create_partitions", len(new_partitions))
+        fs = {}
+        for new_partition in new_partitions:
+            if new_partition.topic not in self.topics:
+                fs[new_partition.topic] = _done(
+                    exception=_unknown_topic(new_partition.topic)
+                )
+                continue
+            if not validate_only:
+                data = self.topics[new_partition.topic]
+                added = new_partition.new_total_count - data["partitions"]
+                assignment = new_partition.replica_assignment or [
+                    data["replica_assignment"][0] for _ in range(added)
+                ]
+                data["replica_assignment"] = data["replica_assignment"] + assignment
+                data["partitions"] = new_partition.new_total_count
+            fs[new_partition.topic] = _done()
+        return fs
+
+    def describe_configs(self, resources, request_timeout=None):
+        self._record("describe_configs", len(resources))
+        fs = {}
+        for resource in resources:
+            if resource.name not in self.topics:
+                fs[resource] = _done(exception=_unknown_topic(resource.name))
+                continue
+            configs = self.topics[resource.name]["configs"]
+            fs[resource] = _done(
+                {
+                    key: ConfigEntry(
+                        key, str(value), source=ConfigSource.DYNAMIC_TOPIC_CONFIG
+                    )
+                    for key, value in configs.items()
+                }
+            )
+        return fs
+
+    def alter_configs(self, resources, request_timeout=None, validate_only=False):
+        self._record("alter_configs", len(resources))
+        fs = {}
+        for resource in resources:
+            if resource.name not in self.topics:
+                fs[resource] = _done(exception=_unknown_topic(resource.name))
+                continue
+            if not validate_only:
+                self.topics[resource.name]["configs"] = dict(resource.set_config_dict)
+            fs[resource] = _done()
+        return fs
+
+    def incremental_alter_configs(
+        self, resources, request_timeout=None, validate_only=False
+    ):
+        self._record("incremental_alter_configs", len(resources))
+        fs = {}
+        for resource in resources:
+            if resource.name not in self.topics:
+                fs[resource] = _done(exception=_unknown_topic(resource.name))
+                continue
+            if not validate_only:
+                configs = self.topics[resource.name]["configs"]
+                for entry in resource.incremental_configs:
+                    if entry.incremental_operation == AlterConfigOpType.DELETE:
+                        configs.pop(entry.name, None)
+                    else:
+                        configs[entry.name] = entry.value
+            fs[resource] = _done()
+        return fs
@@ -0,0 +1,79 @@
+import json
+
+
+class MockResponse(object):
+    def __init__(self, data=None, status_code=200, text=None):
+        self.data = data
+        self.status_code = status_code
+        self.text = text if text is not None else json.dumps(data)
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP error {self.status_code}")
+
+
+class MockMDSTransport(object):
+    """
+    Mock MDSTransport. Keeps rolebindings in memory and records requests.
+    """
+
+    def __init__(self, cluster_id="kafka-cluster-1"):
+        self.cluster_id = cluster_id
+        # [(method, path)] of requests made
+        self.requests = []
+        # [{"principal": str, "role": str, "scope": dict,
+        #   "resourcePatterns": [dict]}] as POSTed
+        self.bindings = []
+        # Principals whose binding requests fail
+        self.failing_principals = set()
+        # Principals whose rolebinding lookups fail
+        self.failing_lookups = set()
+
+    def get(self, path, **kwargs):
+        self.requests.append(("GET", path))
+        if path == "/security/1.0/metadataClusterId":
+            return MockResponse(text=self.cluster_id)
+        return MockResponse(status_code=404)
+
+    def post(self, path, json=None, **kwargs):
+        self.requests.append(("POST", path))
+        parts = path.strip("/").split("/")
+        # /security/1.0/lookup/principal/{principal}/resources
+        if parts[2] == "lookup" and parts[-1] == "resources":
+            # The body is the scope itself, e.g. {"clusters": {...}}
+            if set(json) != {"clusters"}:
+                return MockResponse(status_code=400)
+            if parts[4] in self.failing_lookups:
+                return MockResponse(status_code=500)
+            return MockResponse(self.lookup(parts[4], json))
+        # /security/1.0/principals/{principal}/roles/{role}/bindings
+        if parts[2] == "principals" and parts[-1] == "bindings":
+            principal, role = parts[3], parts[5]
+            if principal in self.failing_principals:
+                return MockResponse(status_code=500)
+            self.bindings.append(
+                {
+                    "principal": principal,
+                    "role": role,
+                    "scope": json["scope"],
+                    "resourcePatterns": json["resourcePatterns"],
+                }
+            )
+            return MockResponse(status_code=204, text="")
+        return MockResponse(status_code=404)
+
+    def lookup(self, principal, scope):
+        """
+        Return the bindings of principal in scope as
+        {principal: {role: [resourcePattern]}}
+        """
+        roles = {}
+        for binding in self.bindings:
+            if binding["principal"] == principal and binding["scope"] == scope:
+                roles.setdefault(binding["role"], []).extend(
+                    binding["resourcePatterns"]
+                )
+        return {principal: roles} if roles else {}
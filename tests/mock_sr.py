@@ -1,7 +1,51 @@
+import threading
 from confluent_kafka.schema_registry import RegisteredSchema
 from confluent_kafka.schema_registry.error import SchemaRegistryError
 
 
+class MockRestClient(object):
+    """
+    Mock of the REST client of SchemaRegistryClient for endpoints the client
+    has no method for
+    """
+
+    def __init__(self, sr_client):
+        self.sr_client = sr_client
+
+    def get(self, url, query=None):
+        query = query or {}
+        self.sr_client.requests.append(("GET " + url, query.get("subjectPrefix")))
+        if url != "schemas":
+            raise SchemaRegistryError(
+                error_code=404, error_message="Not found", http_status_code=404
+            )
+        result = []
+        for subject_name in sorted(self.sr_client.subjects.keys()):
+            if not subject_name.startswith(query.get("subjectPrefix", "")):
+                continue
+            versions = self.sr_client.subjects[subject_name]["versions"]
+            if query.get("latestOnly", "false") == "true":
+                versions = {max(versions.keys()): versions[max(versions.keys())]}
+            for version, schema_id in sorted(versions.items()):
+                result.append(
+                    {
+                        "subject": subject_name,
+                        "version": version,
+                        "id": schema_id,
+                        "schema": self.sr_client.schemas[schema_id].schema_str,
+                        "references": [
+                            {"name": x.name, "subject": x.subject, "version": x.version}
+                            for x in self.sr_client.schemas[schema_id].references or []
+                        ],
+                    }
+                )
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", -1))
+        if limit < 0:
+            return result[offset:]
+        return result[offset : offset + limit]
+
+
 class MockSRClient(object):
     """
     Mock Schema registry client
@@ -17,12 +61,17 @@ class MockSRClient(object):
         #   'compatibility': None
         #  }
         self.subjects = {}
+        self.lock = threading.RLock()
+        # [(method, subject_name)] of requests made
+        self.requests = []
+        self._rest_client = MockRestClient(self)
 
     def get_subjects(self):
         print("Returning subjects: {}".format(self.subjects.keys()))
         return self.subjects.keys()
 
     def lookup_schema(self, subject_name, schema):
+        self.requests.append(("lookup_schema", subject_name))
         if subject_name in self.subjects:
             for version, schema_id in self.subjects[subject_name]["versions"].items():
                 existing_schema = self.schemas[schema_id]
@@ -37,6 +86,49 @@ class MockSRClient(object):
             error_code=40403, error_message="Schema not found", http_status_code=404
         )
 
+    def get_latest_version(self, subject_name):
+        self.requests.append(("get_latest_version", subject_name))
+        if subject_name not in self.subjects:
+            raise SchemaRegistryError(
+                error_code=40401,
+                error_message="Subject not found",
+                http_status_code=404,
+            )
+        versions = self.subjects[subject_name]["versions"]
+        version = sorted(versions.keys())[-1]
+        return RegisteredSchema(
+            schema_id=versions[version],
+            schema=self.schemas[versions[version]],
+            subject=subject_name,
+            version=version,
+        )
+
+    def get_versions(self, subject_name):
+        self.requests.append(("get_versions", subject_name))
+        if subject_name not in self.subjects:
+            raise SchemaRegistryError(
+                error_code=40401,
+                error_message="Subject not found",
+                http_status_code=404,
+            )
+        return sorted(self.subjects[subject_name]["versions"].keys())
+
+    def get_version(self, subject_name, version):
+        self.requests.append(("get_version", subject_name))
+        versions = self.subjects.get(subject_name, {}).get("versions", {})
+        if version not in versions:
+            raise SchemaRegistryError(
+                error_code=40402,
+                error_message="Version not found",
+                http_status_code=404,
+            )
+        return RegisteredSchema(
+            schema_id=versions[version],
+            schema=self.schemas[versions[version]],
+            subject=subject_name,
+            version=version,
+        )
+
     def get_or_add_schema(self, schema):
         for schema_id, existing_schema in self.schemas.items():
             if existing_schema == schema:
@@ -53,19 +145,20 @@ class MockSRClient(object):
         Registered a schema
         """
         print(f"Registerin schema {subject_name} {schema}")
-        schema_id, existng_schema = self.get_or_add_schema(schema)
-        if subject_name in self.subjects:
-            # IT already exist so register a new version
+        with self.lock:
+            schema_id, existng_schema = self.get_or_add_schema(schema)
+            if subject_name in self.subjects:
+                # IT already exist so register a new version
 
-            new_version = (
-                sorted(list(self.subjects[subject_name]["versions"].keys()))[-1] + 1
-            )
-            self.subjects[subject_name]["versions"][new_version] = schema_id
-        else:
-            # New schema
-            self.subjects[subject_name] = {
-                "versions": {1: schema_id},
-            }
+                new_version = (
+                    sorted(list(self.subjects[subject_name]["versions"].keys()))[-1] + 1
+                )
+                self.subjects[subject_name]["versions"][new_version] = schema_id
+            else:
+                # New schema
+                self.subjects[subject_name] = {
+                    "versions": {1: schema_id},
+                }
         print(f"Returning id: {schema_id}")
         return schema_id
 
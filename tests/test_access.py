@@ -0,0 +1,118 @@
+import json
+
+from click.testing import CliRunner
+
+from kafkalo.bindings import BindingIndex
+from kafkalo.cli_access import access, build_index
+from kafkalo.clients import Client, MDSAdmin
+from kafkalo.transport import MDSTransport
+from .mock_mds import MockMDSTransport
+
+MDS_CONFIG = {
+    "url": "http://localhost:8090",
+    "schema-registry-cluster-id": "schemaregistry",
+}
+
+CONFIG = """
+connections:
+  kafka:
+    bootstrap.servers: "localhost:9093"
+  schemaregistry:
+    url: "http://localhost:8081"
+  mds:
+    url: "http://localhost:8090"
+kafkalo:
+  input_dirs:
+    - "tests/data/sample.yaml"
+"""
+
+
+def test_binding_index():
+    index = BindingIndex()
+    bindings = [
+        (1, "User:a", "DeveloperRead", "Topic", "orders.", "PREFIXED"),
+        (1, "User:b", "DeveloperRead", "Topic", "orders.eu.", "PREFIXED"),
+        (1, "User:c", "DeveloperRead", "Topic", "orders.eu.v1", "LITERAL"),
+        (1, "User:d", "DeveloperRead", "Group", "orders.", "PREFIXED"),
+        (2, "User:a", "DeveloperRead", "Subject", "orders.", "PREFIXED"),
+    ]
+    for binding in bindings:
+        index.add(binding, "declared")
+    index.add(bindings[0], "live")
+    assert len(index) == 5
+    assert index.sources[bindings[0]] == {"declared", "live"}
+    # Literal bindings first, then prefixed ones from the broadest prefix
+    assert index.get_resource_bindings("Topic", "orders.eu.v1") == [
+        bindings[2],
+        bindings[0],
+        bindings[1],
+    ]
+    assert index.get_resource_bindings("Topic", "orders.us") == bindings[:1]
+    assert index.get_resource_bindings("Topic", "payments") == []
+    assert index.get_principal_bindings("User:a") == [bindings[0], bindings[4]]
+
+
+def test_binding_index_many_bindings():
+    index = BindingIndex()
+    for x in range(100000):
+        index.add((1, f"User:{x}", "DeveloperRead", "Topic", f"t{x}.", "PREFIXED"), "")
+    assert [x[1] for x in index.get_resource_bindings("Topic", "t123.a")] == [
+        "User:123"
+    ]
+    assert len(index.get_principal_bindings("User:99999")) == 1
+
+
+def test_build_index_with_live_bindings():
+    transport = MockMDSTransport()
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    admin.reconcile_roles([Client("User:old", consumer_for=[{"topic": "orders."}])])
+    clients = [
+        Client("User:app", consumer_for=[{"topic": "orders."}]),
+        Client("User:old", consumer_for=[{"topic": "orders."}]),
+    ]
+    index = build_index(clients, mds_admin=MDSAdmin(MDS_CONFIG, transport=transport))
+    topic = index.get_resource_bindings("Topic", "orders.v1")
+    assert [(x[1], sorted(index.sources[x])) for x in topic] == [
+        ("User:app", ["declared"]),
+        ("User:old", ["declared", "live"]),
+    ]
+
+
+def test_access_command(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text(CONFIG)
+    runner = CliRunner()
+    result = runner.invoke(
+        access, ["--config", str(config), "--resource", "TOPIC1.foo", "--json"]
+    )
+    assert result.exit_code == 0, result.output
+    principals = {x["principal"] for x in json.loads(result.output)}
+    assert principals == {"User:poutanaola", "Group:malakes", "User:produser"}
+
+    result = runner.invoke(
+        access, ["--config", str(config), "--principal", "User:produser"]
+    )
+    assert "ResourceOwner on Group consumer-produser-owner- (LITERAL)" in (
+        result.output
+    )
+
+    result = runner.invoke(access, ["--config", str(config)])
+    assert result.exit_code != 0
+
+
+def test_access_live_json_with_failed_lookup(tmp_path, monkeypatch):
+    transport = MockMDSTransport()
+    transport.failing_lookups.add("User:produser")
+    monkeypatch.setattr(
+        MDSTransport, "from_config", classmethod(lambda cls, config: transport)
+    )
+    config = tmp_path / "config.yaml"
+    config.write_text(CONFIG)
+    result = CliRunner().invoke(
+        access,
+        ["--config", str(config), "--principal", "User:produser", "--live", "--json"],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Failed to get rolebindings of User:produser" in result.stderr
+    bindings = json.loads(result.stdout)
+    assert {x["sources"][0] for x in bindings} == {"declared"}
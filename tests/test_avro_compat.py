@@ -0,0 +1,105 @@
+import json
+import pytest
+from kafkalo.avro_compat import AvroSchemaError, check_can_read, check_compatibility
+
+
+def record(fields, name="User"):
+    return json.dumps({"type": "record", "name": name, "fields": fields})
+
+
+V1 = record([{"name": "id", "type": "long"}])
+V2 = record([{"name": "id", "type": "long"}, {"name": "email", "type": "string"}])
+V2_DEFAULT = record(
+    [
+        {"name": "id", "type": "long"},
+        {"name": "email", "type": ["null", "string"], "default": None},
+    ]
+)
+
+
+def test_added_field_without_default():
+    # New reader can't read old data that lacks email
+    assert check_can_read(V2, V1) == [
+        "email: reader field has no default and is missing from the writer schema"
+    ]
+    # Old reader ignores the extra field
+    assert check_can_read(V1, V2) == []
+    assert check_can_read(V2_DEFAULT, V1) == []
+
+
+def test_promotions_and_unions():
+    int_record = record([{"name": "id", "type": "int"}])
+    assert check_can_read(V1, int_record) == []
+    assert check_can_read(int_record, V1) == ["id: long can't be read as int"]
+    nullable = record([{"name": "id", "type": ["null", "long"]}])
+    assert check_can_read(nullable, V1) == []
+    assert check_can_read(V1, nullable) == ["id: null can't be read as long"]
+
+
+def test_nested_types():
+    writer = json.dumps(
+        {
+            "type": "record",
+            "name": "Order",
+            "namespace": "shop",
+            "fields": [
+                {
+                    "name": "status",
+                    "type": {"type": "enum", "name": "Status", "symbols": ["A", "B"]},
+                },
+                {"name": "tags", "type": {"type": "array", "items": "Status"}},
+            ],
+        }
+    )
+    reader = json.dumps(
+        {
+            "type": "record",
+            "name": "Order",
+            "namespace": "shop",
+            "fields": [
+                {
+                    "name": "status",
+                    "type": {"type": "enum", "name": "Status", "symbols": ["A"]},
+                },
+                {"name": "tags", "type": {"type": "array", "items": "Status"}},
+            ],
+        }
+    )
+    assert check_can_read(reader, writer) == [
+        "status: reader enum is missing symbols ['B']",
+        "tags[]: reader enum is missing symbols ['B']",
+    ]
+    assert check_can_read(writer, reader) == []
+
+
+def test_compatibility_levels():
+    assert check_compatibility(V2, [V1], "backward") != []
+    assert check_compatibility(V2, [V1], "forward") == []
+    assert check_compatibility(V2, [V1], "none") == []
+    assert check_compatibility(V2, [], "full") == []
+    # Only the latest version is checked unless transitive
+    assert check_compatibility(V2_DEFAULT, [V2, V1], "backward") == []
+    assert check_compatibility(V1, [V2, V2_DEFAULT], "forward") == []
+    assert check_compatibility(V1, [V2, V2_DEFAULT], "forward_transitive") == [
+        "FORWARD with v1: email: reader field has no default and is missing "
+        "from the writer schema"
+    ]
+
+
+def test_malformed_schemas():
+    malformed = [
+        {"type": "record", "fields": []},
+        {
+            "type": "record",
+            "name": "R",
+            "fields": [{"name": "a", "type": {"type": "array"}}],
+        },
+        {"type": "fixed", "name": "F"},
+    ]
+    for schema in malformed:
+        schema_str = json.dumps(schema)
+        for reader, writer in ((schema_str, schema_str), (V1, schema_str)):
+            with pytest.raises(AvroSchemaError):
+                check_can_read(reader, writer)
+        with pytest.raises(AvroSchemaError):
+            check_compatibility(schema_str, [schema_str], "full")
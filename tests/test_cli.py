@@ -0,0 +1,127 @@
+import threading
+
+from click.testing import CliRunner
+
+import kafkalo.cli as cli_module
+from kafkalo.cli import reconcile_all
+from kafkalo.clients import MDSAdmin
+from kafkalo.schemas import SchemaAdmin
+from kafkalo.topics import KafkaAdmin
+from .mock_kafka import MockAdminClient
+from .mock_mds import MockMDSTransport
+from .mock_sr import MockSRClient
+
+
+class FakeAdmin(object):
+    """
+    Records calls and optionally blocks until an event is set
+    """
+
+    def __init__(self, name, calls, wait_for=None, done=None):
+        self.name = name
+        self.calls = calls
+        self.wait_for = wait_for
+        self.done = done
+
+    def _run(self):
+        if self.wait_for:
+            assert self.wait_for.wait(timeout=5)
+        self.calls.append(self.name)
+        if self.done:
+            self.done.set()
+
+    def reconcile_topics(self, topics, dry_run=False):
+        self._run()
+
+    def reconcile_schemas(self, schemas, dry_run=False):
+        self._run()
+        return ([], {"failed-subject": {}})
+
+    def reconcile_roles(self, clients, dry_run=False):
+        self._run()
+
+
+def test_reconcile_all_sequential():
+    calls = []
+    failed = reconcile_all(
+        FakeAdmin("topics", calls),
+        FakeAdmin("schemas", calls),
+        FakeAdmin("roles", calls),
+        [],
+        [],
+        [],
+    )
+    assert calls == ["topics", "schemas", "roles"]
+    assert "failed-subject" in failed
+
+
+def test_reconcile_all_parallel():
+    calls = []
+    schemas_done = threading.Event()
+    # Topics can only finish after schemas did, which only works if they run
+    # concurrently. Roles always come after topics.
+    failed = reconcile_all(
+        FakeAdmin("topics", calls, wait_for=schemas_done),
+        FakeAdmin("schemas", calls, done=schemas_done),
+        FakeAdmin("roles", calls),
+        [],
+        [],
+        [],
+        parallel=True,
+    )
+    assert calls == ["schemas", "topics", "roles"]
+    assert "failed-subject" in failed
+
+
+CONFIG = """
+connections:
+  kafka:
+    bootstrap.servers: "localhost:9093"
+  schemaregistry:
+    url: "http://localhost:8081"
+kafkalo:
+  input_dirs:
+    - "{input}"
+  stream_chunk_size: 1
+  schema_snapshot: true
+"""
+
+
+def run_sync(tmp_path, monkeypatch, input_pattern):
+    """
+    Run sync --dry-run in streaming mode against mock clients. Returns the
+    mock schema registry client
+    """
+    sr_client = MockSRClient({})
+    admins = (
+        KafkaAdmin(MockAdminClient(), MockAdminClient()),
+        SchemaAdmin(sr_client),
+        MDSAdmin({"url": "http://localhost:8090"}, transport=MockMDSTransport()),
+    )
+    monkeypatch.setattr(cli_module, "get_admin_clients", lambda config: admins)
+    config = tmp_path / "config.yaml"
+    config.write_text(CONFIG.format(input=input_pattern))
+    result = CliRunner().invoke(
+        cli_module.sync,
+        [
+            "--config",
+            str(config),
+            "--dry-run",
+            "--reassignment-dir",
+            str(tmp_path / "waves"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return sr_client
+
+
+def test_sync_empty_streaming_input(tmp_path, monkeypatch):
+    (tmp_path / "empty.yaml").write_text("topics: []\n")
+    run_sync(tmp_path, monkeypatch, str(tmp_path / "empty.yaml"))
+
+
+def test_sync_streaming_loads_snapshot_once(tmp_path, monkeypatch):
+    sr_client = run_sync(tmp_path, monkeypatch, "tests/data/references/*.yaml")
+    assert [x for x in sr_client.requests if x[0] == "GET schemas"] == [
+        ("GET schemas", "")
+    ]
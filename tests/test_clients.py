@@ -0,0 +1,240 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kafkalo.bindings import PrefixTrie, minimize_bindings
+from kafkalo.clients import Client, MDSAdmin
+from kafkalo.transport import MDSTransport
+from .mock_mds import MockMDSTransport
+
+MDS_CONFIG = {
+    "url": "http://localhost:8090",
+    "username": "user",
+    "password": "password",
+    "schema-registry-cluster-id": "schemaregistry",
+}
+
+
+def test_transport_from_config():
+    transport = MDSTransport.from_config(
+        dict(MDS_CONFIG, timeout=10, retries=2, **{"connect-timeout": 1})
+    )
+    assert transport.timeout == (1.0, 10.0)
+    assert transport.session.auth == ("user", "password")
+    adapter = transport.session.get_adapter("http://localhost:8090")
+    assert adapter.max_retries.total == 2
+    assert 429 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.is_retry("GET", 503)
+    # Rolebinding POSTs may have been applied, only lookups are retried
+    assert not adapter.max_retries.is_retry("POST", 503)
+    adapter = transport.session.get_adapter(
+        "http://localhost:8090/security/1.0/lookup/principal/User:x/resources"
+    )
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.is_retry("POST", 503)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Fails the first request with 503, then answers with the cluster id
+    """
+
+    calls = []
+
+    def do_GET(self):
+        self.calls.append(self.client_address[1])
+        status = 503 if len(self.calls) == 1 else 200
+        body = b"cluster-1"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_transport_retries_and_keeps_connections():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    FlakyHandler.protocol_version = "HTTP/1.1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        transport = MDSTransport(
+            f"http://127.0.0.1:{server.server_port}", backoff_factor=0
+        )
+        response = transport.get("/security/1.0/metadataClusterId")
+        assert response.status_code == 200
+        assert response.text == "cluster-1"
+        transport.get("/security/1.0/metadataClusterId")
+        assert len(FlakyHandler.calls) == 3
+        # The connection was kept alive for the next request
+        assert FlakyHandler.calls[1] == FlakyHandler.calls[2]
+        transport.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_mds_admin_uses_transport():
+    transport = MockMDSTransport()
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    assert admin.kafka_cluster_id == "kafka-cluster-1"
+    admin.reconcile_roles(
+        [Client("User:app", consumer_for=[{"topic": "orders."}])],
+    )
+    assert [x["role"] for x in transport.bindings] == ["DeveloperRead"] * 2
+    assert transport.requests[0] == ("GET", "/security/1.0/metadataClusterId")
+
+
+def count_requests(transport, kind):
+    return len([x for x in transport.requests if x[1].endswith(kind)])
+
+
+def test_only_missing_bindings_are_set():
+    transport = MockMDSTransport()
+    clients = [
+        Client(
+            "User:app",
+            consumer_for=[{"topic": "orders."}],
+            producer_for=[{"topic": "payments.", "strict": True}],
+        )
+    ]
+    MDSAdmin(MDS_CONFIG, transport=transport).reconcile_roles(clients)
+    # DeveloperRead on both subjects is set in one request
+    assert count_requests(transport, "/bindings") == 3
+
+    # Nothing changed: one lookup per context and no writes
+    transport.requests = []
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    admin.reconcile_roles(clients, dry_run=True)
+    assert admin.get_dry_run_plan()["rolebindings"] == []
+    admin.reconcile_roles(clients)
+    assert count_requests(transport, "/resources") == 2
+    assert count_requests(transport, "/bindings") == 0
+
+    clients[0].consumer_for.append({"topic": "refunds", "prefixed": False})
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    admin.reconcile_roles(clients, dry_run=True)
+    plan = admin.get_dry_run_plan()["rolebindings"]
+    assert [x["resourcePatterns"][0]["name"] for x in plan] == ["refunds"] * 2
+    assert plan[0]["resourcePatterns"][0]["patternType"] == "LITERAL"
+
+
+def test_bindings_are_grouped_in_chunks():
+    transport = MockMDSTransport()
+    admin = MDSAdmin(dict(MDS_CONFIG, **{"bindings-per-request": 4}), transport)
+    topics = [{"topic": f"topic{x}.", "prefixed": x % 2 == 0} for x in range(10)]
+    clients = [
+        Client("User:app", consumer_for=topics),
+        Client("Group:team", groups=[{"name": "team-"}]),
+    ]
+    admin.reconcile_roles(clients, dry_run=True)
+    plan = admin.get_dry_run_plan()["rolebindings"]
+    assert [(x["principal"], len(x["resourcePatterns"])) for x in plan] == [
+        ("User:app", 4),
+        ("User:app", 4),
+        ("User:app", 2),
+        ("User:app", 4),
+        ("User:app", 4),
+        ("User:app", 2),
+        ("Group:team", 1),
+    ]
+    assert transport.bindings == []
+
+    admin.reconcile_roles(clients)
+    assert count_requests(transport, "/bindings") == 7
+    assert len([p for x in transport.bindings for p in x["resourcePatterns"]]) == 21
+
+
+def test_prefix_trie():
+    trie = PrefixTrie()
+    trie.add("orders.")
+    trie.add("orders.eu.")
+    assert trie.find_prefix("orders.eu.v1") == "orders."
+    assert trie.find_prefix("orders.") == "orders."
+    assert trie.find_prefix("orders.", proper=True) is None
+    assert trie.find_prefix("orders") is None
+    assert trie.find_prefix("payments.") is None
+
+
+def test_minimize_bindings():
+    bindings = [
+        (1, "User:app", "DeveloperRead", "Topic", "orders.eu.v1", "LITERAL"),
+        (1, "User:app", "DeveloperRead", "Topic", "orders.", "PREFIXED"),
+        (1, "User:app", "DeveloperRead", "Topic", "orders.eu.", "PREFIXED"),
+        (1, "User:app", "DeveloperRead", "Topic", "orders.", "LITERAL"),
+        (1, "User:app", "DeveloperRead", "Topic", "orders.", "PREFIXED"),
+        # Different role, resource type or scope are not covered
+        (1, "User:app", "DeveloperWrite", "Topic", "orders.eu.", "PREFIXED"),
+        (1, "User:app", "DeveloperRead", "Group", "orders.eu.", "PREFIXED"),
+        (2, "User:app", "DeveloperRead", "Topic", "orders.eu.", "PREFIXED"),
+    ]
+    kept, collapsed = minimize_bindings(bindings)
+    assert kept == [bindings[1]] + bindings[5:]
+    assert collapsed == [
+        (bindings[0], "orders."),
+        (bindings[2], "orders."),
+        (bindings[3], "orders."),
+    ]
+
+
+def test_covered_bindings_are_collapsed():
+    transport = MockMDSTransport()
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    clients = [
+        Client(
+            "User:app",
+            consumer_for=[
+                {"topic": "orders."},
+                {"topic": "orders.eu.v1", "prefixed": False},
+            ],
+        ),
+        Client("User:app", consumer_for=[{"topic": "orders.eu."}]),
+    ]
+    admin.reconcile_roles(clients, dry_run=True)
+    plan = admin.get_dry_run_plan()
+    names = [p["name"] for x in plan["rolebindings"] for p in x["resourcePatterns"]]
+    # DeveloperRead on the topic and on the subjects with that prefix
+    assert names == ["orders.", "orders."]
+    collapsed = [(x["name"], x["covered_by"]) for x in plan["collapsed_rolebindings"]]
+    assert ("orders.eu.v1", "orders.") in collapsed
+    assert ("orders.eu.", "orders.") in collapsed
+
+    # On the topic and on the subjects
+    assert len(collapsed) == 4
+
+    # Planning the same clients again doesn't repeat plan entries
+    admin.reconcile_roles(clients, dry_run=True)
+    assert len(admin.get_dry_run_plan()["rolebindings"]) == 2
+    assert len(admin.get_dry_run_plan()["collapsed_rolebindings"]) == 4
+
+
+def test_bindings_covered_by_existing_prefix_are_collapsed():
+    transport = MockMDSTransport()
+    MDSAdmin(MDS_CONFIG, transport=transport).reconcile_roles(
+        [Client("User:app", consumer_for=[{"topic": "orders."}])]
+    )
+    sent = len(transport.bindings)
+
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    clients = [
+        Client("User:app", consumer_for=[{"topic": "orders.eu.v1", "prefixed": False}])
+    ]
+    admin.reconcile_roles(clients, dry_run=True)
+    plan = admin.get_dry_run_plan()
+    assert plan["rolebindings"] == []
+    assert {x["covered_by"] for x in plan["collapsed_rolebindings"]} == {"orders."}
+    admin.reconcile_roles(clients)
+    assert len(transport.bindings) == sent
+
+
+def test_queued_bindings_are_sent_on_apply():
+    transport = MockMDSTransport()
+    admin = MDSAdmin(MDS_CONFIG, transport=transport)
+    admin.do_consumer_for("orders.", "User:app")
+    assert transport.bindings == []
+    admin.apply_rolebindings()
+    assert [x["role"] for x in transport.bindings] == ["DeveloperRead"] * 2
+    assert admin.desired_bindings == {}
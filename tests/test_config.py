@@ -36,3 +36,8 @@ def test_get_input_patterns():
     assert len(input_patterns) == 2
     assert "tests/data/sample.yaml" in input_patterns
     assert "tests/data/*.yaml" in input_patterns
+
+
+def test_get_batch_size():
+    config = Config(filename=SAMPLE_FILE)
+    assert config.get_batch_size() == 500
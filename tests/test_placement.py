@@ -0,0 +1,48 @@
+import pytest
+
+from kafkalo.placement import ReplicaPlacer, PlacementError
+from kafkalo.topics import KafkaAdmin, Topic
+from .mock_kafka import MockAdminClient
+
+
+def test_assign_balances_leaders_and_replicas():
+    adminclient = MockAdminClient(brokers=3)
+    placer = ReplicaPlacer(adminclient.list_topics())
+    assignment = placer.assign(6, 2)
+    assert len(assignment) == 6
+    for replicas in assignment:
+        assert len(set(replicas)) == 2
+    assert placer.leader_count == {1: 2, 2: 2, 3: 2}
+    assert placer.replica_count == {1: 4, 2: 4, 3: 4}
+
+
+def test_assign_accounts_for_existing_load():
+    adminclient = MockAdminClient(brokers=3)
+    adminclient.add_topic("existing", 2, 1, replica_assignment=[[1], [1]])
+    placer = ReplicaPlacer(adminclient.list_topics())
+    assignment = placer.assign(2, 1)
+    assert 1 not in [replicas[0] for replicas in assignment]
+
+
+def test_assign_spreads_racks():
+    adminclient = MockAdminClient(brokers=4)
+    racks = {1: "a", 2: "a", 3: "b", 4: "b"}
+    placer = ReplicaPlacer(adminclient.list_topics(), racks=racks)
+    for replicas in placer.assign(8, 2):
+        assert racks[replicas[0]] != racks[replicas[1]]
+
+
+def test_assign_replication_factor_too_large():
+    placer = ReplicaPlacer(MockAdminClient(brokers=2).list_topics())
+    with pytest.raises(PlacementError):
+        placer.assign(1, 3)
+
+
+def test_create_topics_with_balanced_placement():
+    adminclient = MockAdminClient(brokers=3, racks={1: "a", 2: "b", 3: "c"})
+    kafka_admin = KafkaAdmin(adminclient, adminclient, balanced_placement=True)
+    kafka_admin.reconcile_topics([Topic("topic1", 3, 3), Topic("topic2", 3, 2)])
+    assert adminclient.topics["topic1"]["partitions"] == 3
+    leaders = [x[0] for x in adminclient.topics["topic1"]["replica_assignment"]]
+    assert sorted(leaders) == [1, 2, 3]
+    assert len(adminclient.topics["topic2"]["replica_assignment"][0]) == 2
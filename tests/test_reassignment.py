@@ -0,0 +1,100 @@
+import json
+
+from kafkalo.reassignment import ReassignmentPlanner, load_partition_sizes
+from kafkalo.topics import KafkaAdmin, Topic
+from .mock_kafka import MockAdminClient
+
+
+def test_plan_replication_factor_increase():
+    adminclient = MockAdminClient(brokers=3)
+    adminclient.add_topic("topic1", 4, 1)
+    sizes = {("topic1", x): 100 for x in range(4)}
+    planner = ReassignmentPlanner(
+        adminclient.list_topics(), wave_size=3, partition_sizes=sizes
+    )
+    plan = planner.plan_topic("topic1", 2)
+    assert plan == {
+        "before": 1,
+        "after": 2,
+        "partitions": 4,
+        "bytes": 400,
+        "failed": None,
+    }
+    for move in planner.moves:
+        # existing replica (and leader) is kept
+        assert move["replicas"][0] == move["before"][0]
+        assert len(set(move["replicas"])) == 2
+    waves = planner.get_waves()
+    assert [len(x["partitions"]) for x in waves] == [3, 1]
+
+
+def test_plan_replication_factor_decrease_keeps_leader():
+    adminclient = MockAdminClient(brokers=3)
+    adminclient.add_topic("topic1", 3, 3)
+    planner = ReassignmentPlanner(adminclient.list_topics())
+    plan = planner.plan_topic("topic1", 2)
+    assert plan["partitions"] == 3
+    assert plan["bytes"] is None
+    for move in planner.moves:
+        assert move["replicas"] == move["before"][:1] + move["replicas"][1:]
+        assert len(move["replicas"]) == 2
+
+
+def test_plan_replication_factor_too_large():
+    adminclient = MockAdminClient(brokers=2)
+    adminclient.add_topic("topic1", 1, 1)
+    planner = ReassignmentPlanner(adminclient.list_topics())
+    plan = planner.plan_topic("topic1", 3)
+    assert plan["failed"] is not None
+    assert planner.get_waves() == []
+
+
+def test_reconcile_plans_reassignments(tmp_path):
+    adminclient = MockAdminClient(brokers=3)
+    adminclient.add_topic("topic1", 2, 1)
+    adminclient.add_topic("topic2", 2, 2)
+    kafka_admin = KafkaAdmin(adminclient, adminclient, reassignment_throttle=1000)
+    kafka_admin.reconcile_topics([Topic("topic1", 2, 3), Topic("topic2", 2, 2)])
+    plan = kafka_admin.get_dry_run_plan()
+    assert plan["topic1"]["replication_factor_delta"]["partitions"] == 2
+    assert "topic2" not in plan
+    summary = kafka_admin.reassignment_planner.get_summary()
+    assert summary["waves"] == 1
+    assert summary["throttle"] == 1000
+    filenames = kafka_admin.reassignment_planner.write_waves(tmp_path)
+    with open(filenames[0]) as fp:
+        wave = json.load(fp)
+    assert wave["version"] == 1
+    assert len(wave["partitions"][0]["replicas"]) == 3
+
+
+def test_under_replication_and_partition_sizes(tmp_path):
+    adminclient = MockAdminClient(brokers=3)
+    adminclient.add_topic("my-topic", 1, 2)
+    metadata = adminclient.list_topics()
+    # Second replica out of the ISR (catching up or its broker is down)
+    metadata.topics["my-topic"].partitions[0].isrs = [1]
+    log_dirs = {
+        "brokers": [
+            {
+                "broker": 1,
+                "logDirs": [{"partitions": [{"partition": "my-topic-0", "size": 10}]}],
+            }
+        ]
+    }
+    filename = tmp_path / "log-dirs.json"
+    filename.write_text(json.dumps(log_dirs))
+    sizes = load_partition_sizes(filename)
+    assert sizes == {("my-topic", 0): 10}
+    # Output as printed by the tool
+    filename.write_text(
+        "Querying brokers for log directories information\n"
+        "Received log directory information from brokers 1,2,3\n"
+        f"{json.dumps(log_dirs)}\n"
+    )
+    assert load_partition_sizes(filename) == sizes
+    planner = ReassignmentPlanner(metadata, partition_sizes=sizes)
+    assert planner.under_replication("my-topic") == {
+        "partitions_under_replicated": 1,
+        "lagging_bytes": 10,
+    }
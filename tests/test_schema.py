@@ -1,5 +1,13 @@
-from kafkalo.schemas import Schema, SchemaAdmin
+import pytest
+from confluent_kafka.schema_registry import SchemaReference
+from kafkalo.schemas import (
+    Schema,
+    SchemaAdmin,
+    SchemaDependencyError,
+    dependency_levels,
+)
 from kafkalo.inputparser import InputParser
+from kafkalo.schema_cache import SchemaFingerprintCache
 from .mock_sr import MockSRClient
 
 SAMPLE_PATH = ["tests/data/sample*.yaml"]
@@ -57,3 +65,231 @@ def test_get_subjects_to_update():
     client.reconcile_schemas(schemas)
     to_update = client.get_subjects_to_update(schemas)
     assert len(to_update) == 0
+
+
+def test_reconcile_schemas_concurrently():
+    client = SchemaAdmin(MockSRClient({}), max_workers=4)
+    parser = InputParser(SAMPLE_PATH)
+    schemas = list(reversed(parser.get_schemas()))
+    registered, failed = client.reconcile_schemas(schemas)
+    assert [x.subject_name for x in registered] == sorted(
+        x.subject_name for x in schemas
+    )
+    assert failed == {}
+    assert client.get_subjects_to_update(schemas) == []
+
+    client = SchemaAdmin(MockSRClient({}), max_workers=4)
+    client.reconcile_schemas(schemas, dry_run=True)
+    plan = client.get_dry_run_plan()
+    assert list(plan.keys()) == sorted(plan.keys())
+
+
+def test_fingerprint_cache(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    sr_client = MockSRClient({})
+    parser = InputParser(SAMPLE_PATH)
+    schemas = parser.get_schemas()
+    client = SchemaAdmin(sr_client, cache=SchemaFingerprintCache(cache_file))
+    client.reconcile_schemas(schemas)
+    client.cache.save()
+
+    # A new run answers from the persisted cache without any lookup, only
+    # checking the latest version of each subject
+    sr_client.requests = []
+    client = SchemaAdmin(sr_client, cache=SchemaFingerprintCache(cache_file))
+    assert client.get_subjects_to_update(schemas) == []
+    assert {x[0] for x in sr_client.requests} == {"get_latest_version"}
+
+    # Subjects deleted from the registry are invalidated
+    del sr_client.subjects[schemas[0].subject_name]
+    client = SchemaAdmin(sr_client, cache=SchemaFingerprintCache(cache_file))
+    assert client.get_subjects_to_update(schemas) == [schemas[0]]
+
+
+def test_fingerprint_cache_recreated_subject():
+    sr_client = MockSRClient({})
+    v1 = Schema("test-value", '{"type": "string"}')
+    v2 = Schema("test-value", '{"type": "int"}')
+    client = SchemaAdmin(sr_client)
+    client.reconcile_schemas([v1])
+    client.reconcile_schemas([v2])
+    assert client.cache.get_version("test-value", v2.fingerprint) == 2
+
+    # The subject is deleted and re-created with v1 only
+    del sr_client.subjects["test-value"]
+    sr_client.register_schema("test-value", v1.schema)
+    client = SchemaAdmin(sr_client, cache=client.cache)
+    assert client.get_subjects_to_update([v2]) == [v2]
+    registered, failed = client.reconcile_schemas([v2])
+    assert registered == [v2]
+    assert sorted(sr_client.subjects["test-value"]["versions"]) == [1, 2]
+
+
+def test_formatting_changes_are_not_updates():
+    sr_client = MockSRClient({})
+    client = SchemaAdmin(sr_client)
+    schema = Schema("test-value", '{"type": "string", "name": "a"}')
+    client.reconcile_schemas([schema])
+    reformatted = Schema("test-value", '{\n  "name": "a",\n  "type": "string"\n}')
+    assert reformatted.fingerprint == schema.fingerprint
+    client = SchemaAdmin(sr_client)
+    assert client.get_subjects_to_update([reformatted]) == []
+    changed = Schema("test-value", '{"type": "int", "name": "a"}')
+    assert client.get_subjects_to_update([changed]) == [changed]
+
+
+def test_load_snapshot():
+    sr_client = MockSRClient({})
+    parser = InputParser(SAMPLE_PATH)
+    schemas = parser.get_schemas()
+    SchemaAdmin(sr_client).reconcile_schemas(schemas[1:])
+    sr_client.register_schema("OTHER-value", schemas[0].schema)
+
+    client = SchemaAdmin(sr_client)
+    sr_client.requests = []
+    snapshot = client.load_snapshot(
+        ["SKATA."], subjects=[x.subject_name for x in schemas], page_size=1
+    )
+    assert set(snapshot.keys()) == {x.subject_name for x in schemas[1:]}
+    assert snapshot[schemas[1].subject_name].version == 1
+    assert snapshot[schemas[1].subject_name].fingerprint == schemas[1].fingerprint
+    # One request per page plus the last empty one
+    assert len(sr_client.requests) == 3
+
+    sr_client.requests = []
+    assert client.get_subjects_to_update(schemas) == schemas[:1]
+    assert sr_client.requests == []
+
+
+def test_compatibility_map():
+    sr_client = MockSRClient({})
+    parser = InputParser(SAMPLE_PATH)
+    schemas = parser.get_schemas()
+    SchemaAdmin(sr_client).reconcile_schemas(schemas)
+    sr_client.set_compatibility("SKATA.VROMIA.POLY-value", "FULL")
+
+    client = SchemaAdmin(sr_client)
+    assert client.global_compat == "backward"
+    client.load_compatibility([x.subject_name for x in schemas])
+    assert client.compatibility_map == {
+        "SKATA.VROMIA.POLY-key": None,
+        "SKATA.VROMIA.POLY-value": "full",
+        "SKATA.VROMIA.LIGO-key": None,
+    }
+    assert client.get_compatibility("SKATA.VROMIA.POLY-key") == "backward"
+
+    # POLY-value is declared with NONE: a compatibility-only change
+    client.reconcile_schemas(schemas, dry_run=True)
+    plan = client.get_dry_run_plan()
+    assert list(plan.keys()) == ["SKATA.VROMIA.POLY-value"]
+    assert plan["SKATA.VROMIA.POLY-value"]["status"] == "compatibility"
+    assert plan["SKATA.VROMIA.POLY-value"]["compatibility"] == {
+        "old": "full",
+        "new": "none",
+    }
+    client.reconcile_schemas(schemas)
+    assert sr_client.subjects["SKATA.VROMIA.POLY-value"]["compatibility"] == "none"
+
+
+def test_local_compatibility_check():
+    sr_client = MockSRClient({})
+    v1 = (
+        '{"type": "record", "name": "User", "fields": [{"name": "id", "type": "long"}]}'
+    )
+    v2 = (
+        '{"type": "record", "name": "User", "fields": [{"name": "id", "type": "long"},'
+        ' {"name": "email", "type": "string"}]}'
+    )
+    SchemaAdmin(sr_client).reconcile_schemas([Schema("user-value", v1)])
+
+    client = SchemaAdmin(sr_client, max_workers=2, compat_check=True)
+    sr_client.requests = []
+    new = [Schema("user-value", v2), Schema("other-value", v2)]
+    registered, failed = client.reconcile_schemas(new, dry_run=True)
+    plan = client.get_dry_run_plan()
+    assert plan["user-value"]["status"] == "failed"
+    assert "email: reader field has no default" in plan["user-value"]["reason"]
+    assert plan["other-value"]["status"] == "created"
+    assert list(failed.keys()) == ["user-value"]
+    # The latest version was fetched once while looking the schema up
+    assert sr_client.requests.count(("get_latest_version", "user-value")) == 1
+
+    registered, failed = client.reconcile_schemas(new)
+    assert [x.subject_name for x in registered] == ["other-value"]
+    assert list(sr_client.subjects["user-value"]["versions"].keys()) == [1]
+
+    # Transitive levels fetch every version once, then use the cache
+    sr_client.set_compatibility("user-value", "FORWARD_TRANSITIVE")
+    client = SchemaAdmin(sr_client, cache=client.cache, compat_check=True)
+    sr_client.requests = []
+    assert client.check_compatibility(Schema("user-value", v2)) == []
+    assert ("get_version", "user-value") not in sr_client.requests
+
+    # A malformed schema fails on its own instead of aborting the reconcile
+    malformed = '{"type": "record", "fields": [{"name": "id", "type": "long"}]}'
+    new = [Schema("user-value", malformed), Schema("third-value", v2)]
+    registered, failed = client.reconcile_schemas(new, dry_run=True)
+    plan = client.get_dry_run_plan()
+    assert plan["user-value"]["status"] == "failed"
+    assert "Malformed record schema" in plan["user-value"]["reason"]
+    assert plan["third-value"]["status"] == "created"
+
+
+def test_schema_references():
+    schemas = InputParser(["tests/data/references/*.yaml"]).get_schemas()
+    assert sorted(x.subject_name for x in schemas) == [
+        "SKATA.CUSTOMERS-value",
+        "SKATA.ORDERS-value",
+        "com.acme.Address",
+        "com.acme.Country",
+    ]
+    levels = dependency_levels(schemas)
+    assert [[x.subject_name for x in level] for level in levels] == [
+        ["com.acme.Country"],
+        ["com.acme.Address"],
+        ["SKATA.CUSTOMERS-value", "SKATA.ORDERS-value"],
+    ]
+
+    sr_client = MockSRClient({})
+    client = SchemaAdmin(sr_client, max_workers=4)
+    client.reconcile_schemas(schemas, dry_run=True)
+    assert [x["status"] for x in client.get_dry_run_plan().values()] == ["created"] * 4
+    assert sr_client.subjects == {}
+
+    registered, failed = client.reconcile_schemas(schemas)
+    assert failed == {}
+    assert len(registered) == 4
+    # Shared types are registered once
+    assert len(sr_client.schemas) == 4
+    for subject in sr_client.subjects.values():
+        assert list(subject["versions"].keys()) == [1]
+    orders = sr_client.schemas[sr_client.subjects["SKATA.ORDERS-value"]["versions"][1]]
+    assert [(x.subject, x.version) for x in orders.references] == [
+        ("com.acme.Address", 1)
+    ]
+    # Declared references are left unresolved, resolved versions are kept
+    # aside and count in the fingerprint
+    orders = [x for x in schemas if x.subject_name == "SKATA.ORDERS-value"][0]
+    assert [x.version for x in orders.references] == [None]
+    assert orders.resolved_versions == {"com.acme.Address": 1}
+    assert orders.fingerprint != orders.text_fingerprint
+    other = Schema(
+        orders.subject_name,
+        orders.schema_json,
+        references=[SchemaReference("com.acme.Address", "com.acme.Address", 2)],
+    )
+    assert not client.cache.contains(orders.subject_name, other.fingerprint)
+    assert client.cache.contains(orders.subject_name, orders.fingerprint)
+
+    # Nothing is registered again
+    sr_client.requests = []
+    schemas = InputParser(["tests/data/references/*.yaml"]).get_schemas()
+    registered, failed = client.reconcile_schemas(schemas)
+    assert registered == [] and failed == {}
+
+
+def test_circular_references():
+    a = Schema("a", '"int"', references=[SchemaReference("b", "b", None)])
+    b = Schema("b", '"int"', references=[SchemaReference("a", "a", None)])
+    with pytest.raises(SchemaDependencyError):
+        dependency_levels([a, b])
@@ -0,0 +1,59 @@
+from kafkalo.state import StateStore
+from kafkalo.inputparser import InputParser
+from kafkalo.topics import Topic
+from kafkalo.schemas import SchemaAdmin
+from .mock_sr import MockSRClient
+
+SAMPLE_PATH = ["tests/data/sample*.yaml"]
+
+
+def test_filter_changed(tmp_path):
+    filename = tmp_path / "state.json"
+    parser = InputParser(SAMPLE_PATH)
+    topics = parser.get_topics()
+    state = StateStore(filename)
+    assert len(state.filter_changed(StateStore.TOPICS, topics)) == len(topics)
+    state.record(StateStore.TOPICS, topics)
+    state.save()
+
+    state = StateStore(filename)
+    assert state.filter_changed(StateStore.TOPICS, topics) == []
+    changed = Topic(topics[0].name, 12, 1, configs=topics[0].configs)
+    assert state.filter_changed(StateStore.TOPICS, [changed]) == [changed]
+
+
+def test_schemas_and_clients(tmp_path):
+    parser = InputParser(SAMPLE_PATH)
+    state = StateStore(tmp_path / "state.json")
+    schemas = parser.get_schemas()
+    clients = parser.get_clients()
+    state.record(StateStore.SCHEMAS, schemas[1:])
+    state.record(StateStore.CLIENTS, clients)
+    assert state.filter_changed(StateStore.SCHEMAS, schemas) == schemas[:1]
+    assert state.filter_changed(StateStore.CLIENTS, clients) == []
+    clients[0].groups = [{"name": "new-group"}]
+    assert state.filter_changed(StateStore.CLIENTS, clients) == clients[:1]
+
+
+def test_ttl(tmp_path):
+    state = StateStore(tmp_path / "state.json", ttl=60)
+    topics = [Topic("topic1", 1, 1)]
+    state.record(StateStore.TOPICS, topics, now=1000)
+    assert state.filter_changed(StateStore.TOPICS, topics, now=1030) == []
+    assert state.filter_changed(StateStore.TOPICS, topics, now=1061) == topics
+
+
+def test_schemas_with_references_unchanged(tmp_path):
+    filename = tmp_path / "state.json"
+    sr_client = MockSRClient({})
+    schemas = InputParser(["tests/data/references/*.yaml"]).get_schemas()
+    registered, failed = SchemaAdmin(sr_client).reconcile_schemas(schemas)
+    assert failed == {}
+    state = StateStore(filename)
+    state.record(StateStore.SCHEMAS, schemas)
+    state.save()
+
+    # Resolving reference versions doesn't change the declared schemas
+    schemas = InputParser(["tests/data/references/*.yaml"]).get_schemas()
+    state = StateStore(filename)
+    assert state.filter_changed(StateStore.SCHEMAS, schemas) == []
@@ -1,4 +1,5 @@
-from kafkalo.topics import KafkaAdmin
+from kafkalo.topics import KafkaAdmin, Topic
+from .mock_kafka import MockAdminClient
 
 
 def test_get_config_diff():
@@ -16,3 +17,138 @@ def test_get_config_diff():
     assert "message.max.bytes" not in config_delta
     assert config_delta["retention.ms"]["before"] == "100"
     assert config_delta["retention.ms"]["after"] == "1"
+
+
+def test_reconcile_describes_configs_in_bulk():
+    """
+    Ensure configs for all topics are fetched in chunked bulk requests
+    """
+    adminclient = MockAdminClient()
+    topics = []
+    for i in range(5):
+        name = f"topic{i}"
+        adminclient.add_topic(name, configs={"retention.ms": "100"})
+        topics.append(Topic(name, 1, 1, configs={"retention.ms": "1"}))
+    kafka_admin = KafkaAdmin(adminclient, adminclient, batch_size=2)
+    kafka_admin.reconcile_topics(topics)
+    assert adminclient.requests["describe_configs"] == [2, 2, 1]
+    assert set(kafka_admin.config_snapshot.keys()) == {x.name for x in topics}
+    plan = kafka_admin.get_dry_run_plan()
+    assert plan["topic0"]["config_delta"]["retention.ms"]["before"] == "100"
+    assert adminclient.topics["topic0"]["configs"]["retention.ms"] == "1"
+
+
+def test_reconcile_skips_unchanged_topics():
+    """
+    Ensure only topics with a config delta are sent to alter_configs
+    """
+    adminclient = MockAdminClient()
+    topics = []
+    for i in range(6):
+        name = f"topic{i}"
+        adminclient.add_topic(name, configs={"retention.ms": "100"})
+        # Only odd topics change
+        retention = "100" if i % 2 == 0 else "1"
+        topics.append(Topic(name, 1, 1, configs={"retention.ms": retention}))
+    kafka_admin = KafkaAdmin(adminclient, adminclient, batch_size=2)
+    kafka_admin.reconcile_topics(topics, dry_run=True)
+    assert adminclient.requests["alter_configs"] == [2, 1]
+    plan = kafka_admin.get_dry_run_plan()
+    assert set(plan.keys()) == {"topic1", "topic3", "topic5"}
+    assert plan["topic1"]["configs_altered"] == ["topic1"]
+    assert plan["topic1"]["configs_failed"] == {}
+    # dry run must not change anything
+    assert adminclient.topics["topic1"]["configs"]["retention.ms"] == "100"
+
+
+def test_removed_configs_are_a_change():
+    """
+    Ensure configs removed from the definition are reset by the replace-all
+    alter_configs instead of the topic being skipped as unchanged
+    """
+    adminclient = MockAdminClient()
+    adminclient.add_topic("topic1", configs={"retention.ms": "100", "foo": "bar"})
+    topic = Topic("topic1", 1, 1, configs={"retention.ms": "100"})
+    kafka_admin = KafkaAdmin(adminclient, adminclient)
+    kafka_admin.reconcile_topics([topic])
+    config_delta = kafka_admin.get_dry_run_plan()["topic1"]["config_delta"]
+    assert config_delta == {"foo": {"before": "bar", "after": None}}
+    assert adminclient.topics["topic1"]["configs"] == {"retention.ms": "100"}
+
+    kafka_admin = KafkaAdmin(adminclient, adminclient)
+    kafka_admin.reconcile_topics([topic])
+    assert adminclient.requests["alter_configs"] == [1]
+
+
+def test_incremental_alter_configs():
+    """
+    Ensure incremental mode only sends changed keys and deletes unmanaged ones
+    """
+    adminclient = MockAdminClient()
+    adminclient.add_topic(
+        "topic1",
+        configs={"retention.ms": "100", "cleanup.policy": "delete", "foo": "bar"},
+    )
+    topic = Topic(
+        "topic1", 1, 1, configs={"retention.ms": "1", "cleanup.policy": "delete"}
+    )
+    kafka_admin = KafkaAdmin(adminclient, adminclient, incremental=True)
+    kafka_admin.reconcile_topics([topic])
+    assert "alter_configs" not in adminclient.requests
+    assert adminclient.topics["topic1"]["configs"] == {
+        "retention.ms": "1",
+        "cleanup.policy": "delete",
+        "foo": "bar",
+    }
+
+    kafka_admin = KafkaAdmin(
+        adminclient, adminclient, incremental=True, delete_unmanaged_configs=True
+    )
+    kafka_admin.reconcile_topics([topic])
+    config_delta = kafka_admin.get_dry_run_plan()["topic1"]["config_delta"]
+    assert config_delta == {"foo": {"before": "bar", "after": None}}
+    assert "foo" not in adminclient.topics["topic1"]["configs"]
+
+
+def test_delete_unmanaged_configs_without_configs():
+    """
+    Ensure topics without configs are reconciled when unmanaged configs are
+    deleted
+    """
+    adminclient = MockAdminClient()
+    adminclient.add_topic("topic1", configs={"retention.ms": "100"})
+    topic = Topic("topic1", 1, 1)
+    kafka_admin = KafkaAdmin(adminclient, adminclient, incremental=True)
+    kafka_admin.reconcile_topics([topic])
+    assert adminclient.topics["topic1"]["configs"] == {"retention.ms": "100"}
+
+    kafka_admin = KafkaAdmin(
+        adminclient, adminclient, incremental=True, delete_unmanaged_configs=True
+    )
+    kafka_admin.reconcile_topics([topic])
+    config_delta = kafka_admin.get_dry_run_plan()["topic1"]["config_delta"]
+    assert config_delta == {"retention.ms": {"before": "100", "after": None}}
+    assert adminclient.topics["topic1"]["configs"] == {}
+
+
+def test_increase_partitions():
+    """
+    Ensure partition count increases are detected and sent in bulk
+    """
+    adminclient = MockAdminClient()
+    adminclient.add_topic("topic1", partitions=1)
+    adminclient.add_topic("topic2", partitions=1)
+    adminclient.add_topic("topic3", partitions=6)
+    topics = [Topic("topic1", 3, 1), Topic("topic2", 1, 1), Topic("topic3", 2, 1)]
+    kafka_admin = KafkaAdmin(adminclient, adminclient)
+    kafka_admin.reconcile_topics(topics, dry_run=True)
+    plan = kafka_admin.get_dry_run_plan()
+    assert plan["topic1"]["partitions_delta"] == {"before": 1, "after": 3}
+    assert plan["topic1"]["partitions_failed"] is None
+    assert "topic2" not in plan
+    assert plan["topic3"]["partitions_failed"] is not None
+    assert adminclient.requests["create_partitions"] == [1]
+    assert adminclient.topics["topic1"]["partitions"] == 1
+
+    kafka_admin.reconcile_topics(topics)
+    assert adminclient.topics["topic1"]["partitions"] == 3
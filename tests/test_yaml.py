@@ -1,9 +1,14 @@
+import datetime
+import os
+import subprocess
 import pytest
 
 
+from kafkalo import inputparser, parse_cache
 from kafkalo.inputparser import InputParser, DuplicateResourceException
 from kafkalo.topics import Topic
 from kafkalo.schemas import Schema
+from kafkalo.clients import Client
 
 SAMPLE_PATH = ["tests/data/sample*.yaml"]
 
@@ -77,3 +82,199 @@ def test_clients():
     assert "User:poutanaola" in clients
     assert "Group:malakes" in clients
     assert "User:produser" in clients
+
+
+def test_since_git_ref(tmp_path):
+    """
+    Only resources of changed files (or files referencing a changed schema)
+    are returned
+    """
+
+    def git(*args):
+        subprocess.run(["git"] + list(args), cwd=tmp_path, check=True)
+
+    def write_topic(filename, name, schema):
+        (tmp_path / filename).write_text(
+            f"topics:\n  - name: {name}\n    partitions: 1\n"
+            f"    replication_factor: 1\n    key:\n      schema: {schema}\n"
+        )
+
+    (tmp_path / "a.json").write_text('"string"')
+    (tmp_path / "b.json").write_text('"string"')
+    write_topic("team1.yaml", "TOPIC1", "a.json")
+    write_topic("team2.yaml", "TOPIC2", "b.json")
+    write_topic("team3.yaml", "TOPIC3", "b.json")
+    git("init", "-q")
+    git("add", ".")
+    git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-qm", "1")
+
+    patterns = [str(tmp_path / "*.yaml")]
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        parser = InputParser(patterns, since="HEAD")
+        assert parser.get_topics() == []
+        write_topic("team1.yaml", "TOPIC1", "b.json")
+        parser = InputParser(patterns, since="HEAD")
+        assert [x.name for x in parser.get_topics()] == ["TOPIC1"]
+        (tmp_path / "b.json").write_text('"int"')
+        parser = InputParser(patterns, since="HEAD")
+        assert sorted(x.name for x in parser.get_topics()) == [
+            "TOPIC1",
+            "TOPIC2",
+            "TOPIC3",
+        ]
+        # Duplicates are still detected in files that did not change
+        write_topic("team4.yaml", "TOPIC2", "b.json")
+        with pytest.raises(DuplicateResourceException):
+            InputParser(patterns, since="HEAD")
+    finally:
+        os.chdir(cwd)
+
+
+def test_schema_files_loaded_once(tmp_path):
+    parser = InputParser(SAMPLE_PATH)
+    schemas = parser.get_schemas_as_dict()
+    parser.get_schemas()
+    # schema-key.json is shared by two topics
+    assert sorted(parser.path_index.keys()) == ["schema-key.json", "schema.json"]
+    assert len(parser.schema_files) == 2
+    assert (
+        schemas["SKATA.VROMIA.POLY-key"].fingerprint
+        == schemas["SKATA.VROMIA.LIGO-key"].fingerprint
+    )
+
+    # A modified file is read again
+    schema_file = tmp_path / "key.avsc"
+    schema_file.write_text('"string"')
+    parser = InputParser([str(tmp_path / "*.yaml")])
+    assert parser._load_avsc("key.avsc") == '"string"'
+    schema_file.write_text('"long"')
+    os.utime(schema_file, ns=(0, 0))
+    assert parser._load_avsc("key.avsc") == '"long"'
+
+
+def test_conflicting_definitions(tmp_path):
+    (tmp_path / "a.yaml").write_text(
+        "clients:\n  - principal: User:a\n    producer_for:\n      - topic: A.\n"
+    )
+    (tmp_path / "b.yaml").write_text(
+        "topics: []\nclients:\n  - principal: User:b\n  - principal: User:a\n"
+    )
+    with pytest.raises(DuplicateResourceException) as e:
+        InputParser([str(tmp_path / "*.yaml")])
+    assert str(e.value).startswith("Resource User:a of clients at ")
+    assert f"{tmp_path / 'a.yaml'}:2" in str(e.value)
+    assert f"{tmp_path / 'b.yaml'}:4" in str(e.value)
+
+    # A shared referenced subject must use the same schema everywhere
+    topic = (
+        "  - name: {}\n    partitions: 1\n    replication_factor: 1\n"
+        "    value:\n      schema: v.avsc\n      references:\n"
+        "        - name: Shared\n          subject: Shared\n          schema: {}\n"
+    )
+    (tmp_path / "b.yaml").write_text("topics:\n" + topic.format("A", "s1.avsc"))
+    (tmp_path / "c.yaml").write_text("topics:\n" + topic.format("B", "s1.avsc"))
+    InputParser([str(tmp_path / "*.yaml")])
+    (tmp_path / "c.yaml").write_text("topics:\n" + topic.format("B", "s2.avsc"))
+    with pytest.raises(DuplicateResourceException) as e:
+        InputParser([str(tmp_path / "*.yaml")])
+    assert "Subject Shared" in str(e.value)
+
+    # Same schema but different references is a different schema too
+    (tmp_path / "c.yaml").write_text(
+        "topics:\n"
+        + topic.format("B", "s1.avsc")
+        + "          references:\n"
+        + "            - name: Other\n              subject: Other\n"
+    )
+    with pytest.raises(DuplicateResourceException) as e:
+        InputParser([str(tmp_path / "*.yaml")])
+    assert "Subject Shared" in str(e.value)
+
+
+def test_streaming():
+    patterns = SAMPLE_PATH + ["tests/data/references/*.yaml"]
+    parser = InputParser(patterns)
+    topics = parser.get_topics()
+    schemas = parser.get_schemas()
+    clients = parser.get_clients()
+
+    streaming = InputParser(patterns, streaming=True)
+    assert streaming.data == {}
+    resources = list(streaming.iter_resources())
+    assert [x.name for x in resources if isinstance(x, Topic)] == [
+        x.name for x in topics
+    ]
+    # Shared referenced subjects are yielded once, before their dependents
+    subjects = [x.subject_name for x in resources if isinstance(x, Schema)]
+    assert sorted(subjects) == sorted(x.subject_name for x in schemas)
+    assert subjects.index("com.acme.Address") < subjects.index("SKATA.ORDERS-value")
+    assert len([x for x in resources if isinstance(x, Client)]) == len(clients)
+
+    streaming = InputParser(patterns, streaming=True)
+    chunked = list(streaming.iter_chunks(4))
+    assert all(len(t) + len(s) + len(c) <= 4 for t, s, c in chunked)
+    assert sum(len(t) + len(s) + len(c) for t, s, c in chunked) == len(resources)
+
+
+def test_parallel_parsing(tmp_path, capsys):
+    for index in range(8):
+        (tmp_path / f"team{index}.yaml").write_text(
+            f"topics:\n  - name: TOPIC{index}\n    partitions: 1\n"
+            f"    replication_factor: 1\n"
+        )
+    (tmp_path / "broken.yaml").write_text("topics: [\n")
+    patterns = [str(tmp_path / "*.yaml")]
+    serial = InputParser(patterns)
+    capsys.readouterr()
+    parallel = InputParser(patterns, workers=3)
+    assert parallel.data == serial.data
+    assert [x.name for x in parallel.get_topics()] == [f"TOPIC{x}" for x in range(8)]
+    assert f"Failed to open file {tmp_path / 'broken.yaml'}" in capsys.readouterr().out
+
+    (tmp_path / "team9.yaml").write_text(
+        "topics:\n  - name: TOPIC0\n    partitions: 2\n    replication_factor: 1\n"
+    )
+    with pytest.raises(DuplicateResourceException) as e:
+        InputParser(patterns, workers=3)
+    assert f"{tmp_path / 'team9.yaml'}:2 already declared" in str(e.value)
+
+
+def test_parse_cache_skips_non_json_values(tmp_path):
+    cache = parse_cache.ParseCache(tmp_path)
+    key = cache.key("yaml", b"a: 2024-01-01\n1: b\n")
+    cache.put(key, [{"a": datetime.date(2024, 1, 1)}, {}])
+    cache.put(key, [{1: "b"}, {}])
+    assert cache.get(key) is None
+    cache.put(key, [{"a": "b"}, {"a": [1]}])
+    assert cache.get(key) == [{"a": "b"}, {"a": [1]}]
+
+
+def test_parse_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    parser = InputParser(SAMPLE_PATH, cache_dir=str(cache_dir))
+    schemas = parser.get_schemas()
+    # One entry per YAML file and per schema file
+    entries = list(cache_dir.glob("*/*.json"))
+    assert len(entries) == len(parser.filenames) + 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed a cached file")
+
+    monkeypatch.setattr(inputparser, "_LineLoader", fail)
+    monkeypatch.setattr(inputparser, "canonical_fingerprint", fail)
+    cached = InputParser(SAMPLE_PATH, cache_dir=str(cache_dir))
+    assert cached.data == parser.data
+    assert [x.fingerprint for x in cached.get_schemas()] == [
+        x.fingerprint for x in schemas
+    ]
+
+    # Unreadable entries are a miss
+    entries[0].write_bytes(b"\x80\x04not json")
+    assert parse_cache.ParseCache(cache_dir).get(entries[0].stem) is None
+
+    # A different kafkalo version doesn't use the cached entries
+    monkeypatch.setattr(parse_cache, "__version__", "0.0.0")
+    # Parsing fails with the patched loader, so nothing is loaded
+    assert InputParser(SAMPLE_PATH, cache_dir=str(cache_dir)).data == {}